@@ -1,41 +1,111 @@
 # To run: `uvicorn app.api:app --host 0.0.0.0 --port 80000 --reload`
 from app.pipeline import run_once
 from fastapi import FastAPI, Form, Request
-from fastapi.responses import RedirectResponse, JSONResponse
+from fastapi.responses import RedirectResponse, JSONResponse, Response, FileResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from pathlib import Path
+from contextlib import asynccontextmanager
 from app.ocr import ocr_folder
-import json
+import asyncio
+import os
+import threading
+import time
+from app.jsonio import read_json, read_json_fields, write_json
 
 BASE_DIR = Path(__file__).resolve().parent.parent  # project root
 RUNS_DIR = BASE_DIR / "static" / "runs"
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # keeps the recent-runs list fresh in the background, see _refresh_runs_loop
+    refresher = asyncio.create_task(_refresh_runs_loop())
+    try:
+        yield
+    finally:
+        refresher.cancel()
+
+app = FastAPI(lifespan=lifespan)
+
+class CachedStaticFiles(StaticFiles):
+    """
+    StaticFiles already sends ETag/Last-Modified and answers If-None-Match with 304.
+    This adds Cache-Control so browsers can skip the revalidation round-trip.
+    Crops of a finished run never change, so they are cached as immutable.
+    """
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        if Path(full_path).parent.name == "crops":
+            response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        else:
+            response.headers["Cache-Control"] = "public, max-age=60, stale-while-revalidate=600"
+        return response
 
 # static + templates
-app.mount("/static", StaticFiles(directory=str(BASE_DIR / "static")), name="static")
+app.mount("/static", CachedStaticFiles(directory=str(BASE_DIR / "static")), name="static")
 templates = Jinja2Templates(directory=str(BASE_DIR / "templates"))
 
-# list recent runs (sorted by mtime desc)
-def _recent_runs(n: int = 12):
-    runs_dir = BASE_DIR / "static" / "runs"
-    if not runs_dir.exists():
+_RUNS_REFRESH_INTERVAL = 5.0  # seconds between background rescans of RUNS_DIR
+# run ids with a meta.json, newest first; "pushed" holds runs added by _push_run since the
+# last completed rescan, so a scan that started before their meta.json existed can't drop them
+_RUN_CACHE = {"ts": 0.0, "runs": [], "pushed": []}
+_RUN_CACHE_LOCK = threading.Lock()
+
+def _scan_runs() -> list[tuple[str, float, bool]]:
+    """(name, mtime, has meta.json) for every run dir, in a single scandir pass"""
+    if not RUNS_DIR.exists():
         return []
-    items = []
-    for d in runs_dir.iterdir():
-        if d.is_dir() and (d / "meta.json").exists():
-            items.append((d.name, d.stat().st_mtime))
+    runs = []
+    with os.scandir(RUNS_DIR) as it:
+        for entry in it:
+            if not entry.is_dir(follow_symlinks=False):
+                continue
+            has_meta = os.path.isfile(os.path.join(entry.path, "meta.json"))
+            runs.append((entry.name, entry.stat().st_mtime, has_meta))
+    return runs
+
+def _refresh_runs() -> None:
+    items = [(name, mtime) for name, mtime, has_meta in _scan_runs() if has_meta]
     items.sort(key=lambda t: t[1], reverse=True)
-    return [i[0] for i in items[:n]]
+    runs = [i[0] for i in items]
+    with _RUN_CACHE_LOCK:
+        scanned = set(runs)
+        # pushed runs have their meta.json by now, so every later scan includes them
+        pushed = [r for r in _RUN_CACHE["pushed"]
+                  if r not in scanned and (RUNS_DIR / r / "meta.json").is_file()]
+        _RUN_CACHE["runs"] = pushed + runs
+        _RUN_CACHE["pushed"] = []
+        _RUN_CACHE["ts"] = time.monotonic()
+
+def _push_run(run_id: str) -> None:
+    """Put a just-finished run on top without waiting for the next rescan"""
+    with _RUN_CACHE_LOCK:
+        _RUN_CACHE["runs"] = [run_id] + [r for r in _RUN_CACHE["runs"] if r != run_id]
+        _RUN_CACHE["pushed"] = [run_id] + [r for r in _RUN_CACHE["pushed"] if r != run_id]
+
+async def _refresh_runs_loop() -> None:
+    while True:
+        try:
+            await asyncio.to_thread(_refresh_runs)
+        except Exception as e:
+            print(f"[ERROR] Refreshing runs list failed: {e}")
+        await asyncio.sleep(_RUNS_REFRESH_INTERVAL)
+
+# list recent runs (sorted by mtime desc), served from the background-refreshed snapshot
+def _recent_runs(n: int = 12):
+    if not _RUN_CACHE["ts"]:  # refresher not started yet
+        _refresh_runs()
+    return _RUN_CACHE["runs"][:n]
 
 def _latest_run_dir() -> Path | None:
-    if not RUNS_DIR.exists():
-        return None
-    run_dirs = [p for p in RUNS_DIR.iterdir() if p.is_dir()]
-    if not run_dirs:
+    # fresh scan: this is an action endpoint, a just-finished run must be visible
+    runs = _scan_runs()
+    if not runs:
         return None
     # newest by modification time
-    return max(run_dirs, key=lambda p: p.stat().st_mtime)
+    name = max(runs, key=lambda r: r[1])[0]
+    return RUNS_DIR / name
 
 @app.get("/")
 def home(request: Request):
@@ -44,22 +114,33 @@ def home(request: Request):
 @app.post("/run-sync")
 def run_sync(site: str = Form("lidl"), num_prospekt: int = Form(1), conf: float = Form(0.25)):
     meta = run_once(site, conf, num_prospekt)
+    _push_run(meta["run_id"])
     return RedirectResponse(url=f"/done/{meta['run_id']}", status_code=303)
 
+DONE_FIELDS = ("run_id", "site", "count", "ocr")
+
 # lightweight done page that auto-redirects back to "/"
 @app.get("/done/{run_id}")
 def done(request: Request, run_id: str):
     meta_path = BASE_DIR / "static" / "runs" / run_id / "meta.json"
-    meta = json.loads(meta_path.read_text("utf-8")) if meta_path.exists() else {"run_id": run_id}
+    # the page only needs the summary, not the (possibly large) items list
+    meta = read_json_fields(meta_path, DONE_FIELDS) if meta_path.exists() else {"run_id": run_id}
     return templates.TemplateResponse("done.html", {"request": request, "meta": meta})
 
 # raw meta.json for quick inspection
 @app.get("/runs/{run_id}/meta")
-def run_meta(run_id: str):
+def run_meta(request: Request, run_id: str):
     meta_path = BASE_DIR / "static" / "runs" / run_id / "meta.json"
     if not meta_path.exists():
         return JSONResponse({"error": "meta.json not found"}, status_code=404)
-    return JSONResponse(json.loads(meta_path.read_text("utf-8")))
+    # meta.json is patched by OCR re-runs, so revalidate every time (no-cache) via ETag.
+    # The ETag comes from stat(), the file itself is streamed without parsing.
+    st = meta_path.stat()
+    etag = f'W/"{st.st_mtime_ns:x}-{st.st_size:x}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return FileResponse(meta_path, media_type="application/json", headers=headers, stat_result=st)
 
 @app.post("/runs/{run_id}/ocr")
 def rerun_ocr(run_id: str):
@@ -73,9 +154,9 @@ def rerun_ocr(run_id: str):
     # patch meta.json if present
     meta_path = run_dir / "meta.json"
     if meta_path.exists():
-        meta = json.loads(meta_path.read_text("utf-8"))
+        meta = read_json(meta_path)
         meta["ocr"] = info
-        meta_path.write_text(json.dumps(meta, ensure_ascii=False, indent=2), "utf-8")
+        write_json(meta_path, meta)
     return JSONResponse(info)
 
 @app.post("/run-ocr-latest")
@@ -97,11 +178,11 @@ def run_ocr_latest():
     meta_path = run_dir / "meta.json"
     if meta_path.exists():
         try:
-            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+            meta = read_json(meta_path)
         except Exception:
             meta = {}
         meta["ocr"] = info
-        meta_path.write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
+        write_json(meta_path, meta)
 
     # Redirect to the existing "done" page for this run (so the user sees results)
     return RedirectResponse(url=f"/done/{run_dir.name}", status_code=303)
@@ -0,0 +1,174 @@
+"""
+YOLO product detector running the exported ONNX model directly on ONNX Runtime.
+Pre/post-processing mirrors Ultralytics (letterbox to imgsz, conf filter, NMS).
+"""
+from __future__ import annotations
+import ast
+import os
+import threading
+import cv2
+import numpy as np
+import onnxruntime as ort
+from PIL import Image
+
+
+MODEL_PATH = "models/best.onnx"
+YOLO_BATCH = int(os.getenv("YOLO_BATCH", "8"))  # max pages per forward pass
+YOLO_IMGSZ = int(os.getenv("YOLO_IMGSZ", "640"))  # export size of best.onnx
+# e.g. "cpu", "cuda:0"; defaults to the first GPU when onnxruntime-gpu is installed
+YOLO_DEVICE = os.getenv("YOLO_DEVICE") or (
+    "cuda:0" if "CUDAExecutionProvider" in ort.get_available_providers() else "cpu"
+)
+# YOLO_TRT=1 runs on the TensorRT execution provider (FP16) when onnxruntime-gpu ships it;
+# built engines are cached in TRT_CACHE_DIR so only the first start pays the build
+YOLO_TRT = os.getenv("YOLO_TRT", "0") == "1"
+TRT_CACHE_DIR = os.getenv("TRT_CACHE_DIR", "models/trt_cache")
+IOU_DEFAULT = 0.7   # Ultralytics predict default
+MAX_DET = 300
+PAD_VALUE = 114 / 255.0
+
+class YoloService:
+    def __init__(self, conf: float = 0.25, iou: float = IOU_DEFAULT, imgsz: int = YOLO_IMGSZ):
+        self.conf = conf
+        self.iou = iou
+        self.imgsz = imgsz
+        self.device = YOLO_DEVICE
+        if self.device.startswith("cuda"):
+            device_id = int(self.device.partition(":")[2] or 0)
+            providers = [("CUDAExecutionProvider", {"device_id": device_id}), "CPUExecutionProvider"]
+            if YOLO_TRT and "TensorrtExecutionProvider" in ort.get_available_providers():
+                providers.insert(0, ("TensorrtExecutionProvider", {
+                    "device_id": device_id,
+                    "trt_fp16_enable": True,
+                    "trt_engine_cache_enable": True,
+                    "trt_engine_cache_path": TRT_CACHE_DIR,
+                }))
+        else:
+            providers = ["CPUExecutionProvider"]
+        # the session stays alive on the instance, see get_yolo()
+        self.sess = ort.InferenceSession(MODEL_PATH, providers=providers)
+        self.input_name = self.sess.get_inputs()[0].name
+        self.output_name = self.sess.get_outputs()[0].name
+        self.binding = self.sess.io_binding()
+        # reusable NCHW float32 input / output buffers, grown on demand
+        self._in_buf = np.empty((0, 3, imgsz, imgsz), dtype=np.float32)
+        self._out_buf: np.ndarray | None = None
+        self._lock = threading.Lock()  # buffers are shared between callers
+
+    def predict_pil(self, img: Image.Image, conf: float | None = None):
+        bgr = np.asarray(img.convert("RGB"))[..., ::-1]
+        return self.predict_batch([bgr], conf=conf)[0]
+
+    def predict_batch(self, imgs: list[np.ndarray | Image.Image], conf: float | None = None,
+                      orig_shapes: list[tuple[int, int]] | None = None) -> list[list[dict]]:
+        """
+        Run detection on several images (PIL or BGR arrays), at most YOLO_BATCH per forward pass.
+        Returns one list of dets per image. If the images are downscaled copies, pass the
+        (H, W) of the originals as `orig_shapes` to get boxes in original pixels.
+        """
+        conf = self.conf if conf is None else conf
+        imgs = [np.asarray(im.convert("RGB"))[..., ::-1] if isinstance(im, Image.Image) else im
+                for im in imgs]
+        shapes = orig_shapes or [im.shape[:2] for im in imgs]
+        all_dets = []
+        for start in range(0, len(imgs), YOLO_BATCH):
+            chunk = imgs[start:start + YOLO_BATCH]
+            with self._lock:
+                letterbox = [self._preprocess(im, i, len(chunk)) for i, im in enumerate(chunk)]
+                out = self._run(len(chunk))
+                all_dets.extend(
+                    _postprocess(out[i], letterbox[i], im.shape[:2], shapes[start + i], conf, self.iou)
+                    for i, im in enumerate(chunk)
+                )
+        return all_dets
+
+    def _preprocess(self, img: np.ndarray, idx: int, n: int) -> tuple[float, int, int]:
+        """Letterbox a BGR image into slot `idx` of the input buffer; returns (ratio, left, top)"""
+        if self._in_buf.shape[0] < n:
+            self._in_buf = np.empty((n, 3, self.imgsz, self.imgsz), dtype=np.float32)
+        h, w = img.shape[:2]
+        r = min(self.imgsz / h, self.imgsz / w)
+        nw, nh = round(w * r), round(h * r)
+        left = round((self.imgsz - nw) / 2 - 0.1)
+        top = round((self.imgsz - nh) / 2 - 0.1)
+        resized = cv2.resize(img, (nw, nh), interpolation=cv2.INTER_LINEAR) if (nw, nh) != (w, h) else img
+        slot = self._in_buf[idx]
+        slot.fill(PAD_VALUE)
+        # BGR HWC uint8 -> RGB CHW float32 in [0, 1], written in place
+        np.multiply(resized[..., ::-1].transpose(2, 0, 1), 1 / 255.0,
+                    out=slot[:, top:top + nh, left:left + nw], casting="unsafe")
+        return r, left, top
+
+    def _run(self, n: int) -> np.ndarray:
+        inp = self._in_buf[:n]
+        self.binding.bind_cpu_input(self.input_name, inp)
+        out_shape = self.sess.get_outputs()[0].shape
+        if self._out_buf is None or self._out_buf.shape[0] != n:
+            # (batch, 4 + num_classes, anchors); anchor count follows from imgsz and strides 8/16/32
+            anchors = sum((self.imgsz // s) ** 2 for s in (8, 16, 32))
+            channels = out_shape[1] if isinstance(out_shape[1], int) else 4 + self._num_classes()
+            self._out_buf = np.empty((n, channels, anchors), dtype=np.float32)
+        self.binding.bind_output(self.output_name, "cpu", 0, np.float32,
+                                 list(self._out_buf.shape), self._out_buf.ctypes.data)
+        self.sess.run_with_iobinding(self.binding)
+        return self._out_buf
+
+    def _num_classes(self) -> int:
+        names = self.sess.get_modelmeta().custom_metadata_map.get("names", "{0: 'Product'}")
+        return len(ast.literal_eval(names))
+
+def _postprocess(pred: np.ndarray, letterbox: tuple[float, int, int], shape: tuple[int, int],
+                 orig_shape: tuple[int, int], conf: float, iou: float) -> list[dict]:
+    """Decode one (4 + nc, anchors) prediction into detection dicts in original image pixels"""
+    pred = pred.T
+    scores_all = pred[:, 4:]
+    class_ids = scores_all.argmax(1)
+    scores = scores_all[np.arange(len(pred)), class_ids]
+    keep = scores > conf
+    if not keep.any():
+        return []
+    xywh, scores, class_ids = pred[keep, :4], scores[keep], class_ids[keep]
+
+    # xywh -> xyxy, class offset so NMS never merges boxes of different classes
+    xyxy = np.empty_like(xywh)
+    xyxy[:, :2] = xywh[:, :2] - xywh[:, 2:] / 2
+    xyxy[:, 2:] = xywh[:, :2] + xywh[:, 2:] / 2
+    offset = class_ids[:, None] * 7680.0
+    idx = _nms(xyxy + offset, scores, iou)[:MAX_DET]
+
+    r, left, top = letterbox
+    h, w = shape
+    oh, ow = orig_shape
+    boxes = xyxy[idx]
+    boxes[:, [0, 2]] = ((boxes[:, [0, 2]] - left) / r).clip(0, w) * (ow / w)
+    boxes[:, [1, 3]] = ((boxes[:, [1, 3]] - top) / r).clip(0, h) * (oh / h)
+    return [{"class_id": int(c), "score": float(s), "box": [int(v) for v in b]}
+            for b, s, c in zip(boxes, scores[idx], class_ids[idx])]
+
+def _nms(boxes: np.ndarray, scores: np.ndarray, iou: float) -> np.ndarray:
+    """Greedy NMS, returns kept indices sorted by descending score"""
+    x1, y1, x2, y2 = boxes.T
+    areas = (x2 - x1) * (y2 - y1)
+    order = scores.argsort()[::-1]
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        iw = (np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest])).clip(0)
+        ih = (np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest])).clip(0)
+        inter = iw * ih
+        order = rest[inter / (areas[i] + areas[rest] - inter + 1e-9) <= iou]
+    return np.array(keep, dtype=np.int64)
+
+_YOLO: YoloService | None = None
+_YOLO_LOCK = threading.Lock()
+
+def get_yolo() -> YoloService:
+    """Return the shared YoloService, loading the model on first use"""
+    global _YOLO
+    if _YOLO is None:
+        with _YOLO_LOCK:
+            if _YOLO is None:
+                _YOLO = YoloService()
+    return _YOLO
@@ -0,0 +1,19 @@
+"""
+Directory listing helpers for run and page folders.
+"""
+from __future__ import annotations
+import os
+from fnmatch import fnmatchcase
+from pathlib import Path
+
+
+def sorted_files(directory: Path, pattern: str = "*.jpg") -> list[Path]:
+    """
+    Files in `directory` matching `pattern`, sorted by name.
+    One os.scandir pass; the file-type check comes from the directory entry, not a stat() per file.
+    """
+    with os.scandir(directory) as it:
+        paths = [e.path for e in it
+                 if fnmatchcase(e.name, pattern) and e.is_file(follow_symlinks=False)]
+    paths.sort()
+    return [Path(p) for p in paths]
@@ -0,0 +1,68 @@
+"""
+JSON helpers for run artifacts (meta.json, ocr.json).
+Uses orjson when it is installed and falls back to the stdlib json module.
+"""
+from __future__ import annotations
+from pathlib import Path
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # optional speed-up, stdlib is fine
+    orjson = None
+    import json
+
+try:
+    import simdjson  # on-demand parsing, used to pick a few top-level fields
+except ImportError:
+    simdjson = None
+
+
+def loads(data: bytes | str) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj: Any) -> bytes:
+    """Serialize to UTF-8 bytes, indented by 2 spaces (non-ASCII kept as-is)."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8")
+
+
+def dumps_line(obj: Any) -> bytes:
+    """Compact single-line serialization with trailing newline, for JSONL files."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS) + b"\n"
+    return json.dumps(obj, ensure_ascii=False).encode("utf-8") + b"\n"
+
+
+def read_json(path: Path) -> Any:
+    return loads(path.read_bytes())
+
+
+def write_json(path: Path, obj: Any) -> None:
+    path.write_bytes(dumps(obj))
+
+
+def read_json_fields(path: Path, keys: tuple[str, ...]) -> dict:
+    """
+    Read only the given top-level keys of a JSON object file.
+    With pysimdjson the other fields are never materialized as Python objects.
+    """
+    if simdjson is None:
+        data = read_json(path)
+        return {k: data[k] for k in keys if k in data}
+    doc = simdjson.Parser().parse(path.read_bytes())
+    out = {}
+    for k in keys:
+        if k not in doc:
+            continue
+        v = doc[k]
+        if isinstance(v, simdjson.Object):
+            v = v.as_dict()
+        elif isinstance(v, simdjson.Array):
+            v = v.as_list()
+        out[k] = v
+    return out
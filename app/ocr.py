@@ -5,20 +5,52 @@ FREE tier available with generous limits!
 from __future__ import annotations
 import os
 from pathlib import Path
-import json, csv
+import csv, re
 import google.generativeai as genai
 from PIL import Image
 from typing import Optional
+import asyncio
 import time
+from app import jsonio
+from app.files import sorted_files
+
+try:
+    import pyarrow as pa
+    from pyarrow import csv as pacsv
+except ImportError:  # optional, csv.DictWriter is used otherwise
+    pa = None
 
 
 GEN_DEFAULT = "gemini-2.0-flash"
 REQUIRED_METHOD = "generateContent"   # Needed for images
+CONCURRENCY_DEFAULT = 5
+BATCH_SIZE_DEFAULT = 4   # crops per Gemini request; 1 disables batching
+CSV_FIELDS = ["file", "name_ocr", "price_raw", "price_eur"]
+# Markdown code fence around the model's JSON answer, closing fence optional
+_CODE_BLOCK = re.compile(r"```(?:json)?\s*(.*?)(?:```|$)", re.DOTALL)
+
+class _RateLimiter:
+    """Token bucket with a single token: request starts are spaced `interval` seconds apart."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._lock = asyncio.Lock()
+        self._next_slot = 0.0
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            now = time.monotonic()
+            if self._next_slot > now:
+                await asyncio.sleep(self._next_slot - now)
+            self._next_slot = max(now, self._next_slot) + self.interval
 
 class GeminiProductExtractor:
-    def __init__(self, api_key: str, model: Optional[str] = None, rate_limit_delay: float = 0.5):
+    def __init__(self, api_key: str, model: Optional[str] = None, rate_limit_delay: float = 0.5,
+                 concurrency: int = CONCURRENCY_DEFAULT, batch_size: int = BATCH_SIZE_DEFAULT):
         self.api_key = api_key
         self.rate_limit_delay = rate_limit_delay
+        self.concurrency = max(1, concurrency)
+        self.batch_size = max(1, batch_size)
         genai.configure(api_key=api_key)
         # prefer passed-in model, else env/default
         preferred = model or GEN_DEFAULT
@@ -50,6 +82,51 @@ Image with Pepsi and "0,69€*" → {"name": "Pepsi Cola", "price": 0.69}
 Image with ski jacket and "17,99*" → {"name": "Crivit Ski-Jacke", "price": 17.99}
 Image with pasta and "1,29*" → {"name": "Combino Fusilli XXL", "price": 1.29}"""
     
+    def _get_batch_prompt(self, k: int) -> str:
+        """Get the extraction prompt for k images sent in one request"""
+        return f"""You will receive {k} product flyer images, labelled "Image 1" to "Image {k}".
+For EACH image separately, extract:
+1. Product name (the main product being advertised)
+2. Final price (the largest, most prominent price after any discounts)
+
+Return ONLY a JSON array with exactly {k} objects, one per image, in the same order as the images:
+[
+  {{"name": "product name here", "price": 1.23}},
+  ...
+]
+
+Important rules:
+- Extract the actual product name, not just the brand
+- Price must be a decimal number (e.g., 0.69 not "0,69€")
+- Ignore asterisks (*) after prices
+- Return the FINAL discounted price (the biggest, most prominent one)
+- If something is missing, use null (still return an object for that image)
+- Do NOT include any explanation, ONLY the JSON array"""
+
+    def extract_batch(self, image_paths: list[Path]) -> list[dict] | None:
+        """
+        Extract product info from several images with a single request.
+        Returns None if the request fails or the answer does not have one object per image;
+        callers then fall back to `extract` per image.
+        """
+        try:
+            parts = [self._get_batch_prompt(len(image_paths))]
+            for i, image_path in enumerate(image_paths, 1):
+                parts += [f"Image {i}:", Image.open(image_path)]
+
+            response = self.model.generate_content(
+                parts,
+                generation_config=genai.types.GenerationConfig(
+                    temperature=0.1,
+                    max_output_tokens=300 * len(image_paths),
+                )
+            )
+            return self._parse_batch_response(response.text.strip(), len(image_paths))
+
+        except Exception as e:
+            print(f"[WARNING] Batch request for {len(image_paths)} images failed: {e}")
+            return None
+
     def extract(self, image_path: Path) -> dict:
         """Extract product info from a single image"""
         try:
@@ -80,90 +157,125 @@ Image with pasta and "1,29*" → {"name": "Combino Fusilli XXL", "price": 1.29}"
         """Parse JSON from Gemini response"""
         try:
             # Clean markdown code blocks if present
-            if "```json" in response_text:
-                response_text = response_text.split("```json")[1].split("```")[0].strip()
-            elif "```" in response_text:
-                response_text = response_text.split("```")[1].split("```")[0].strip()
+            m = _CODE_BLOCK.search(response_text)
+            if m:
+                response_text = m.group(1).strip()
             
             # Parse JSON
-            result = json.loads(response_text)
+            result = jsonio.loads(response_text)
             
             return {
                 "name": result.get("name", ""),
                 "price": result.get("price"),
             }
-        except json.JSONDecodeError as e:
+        except ValueError as e:  # JSONDecodeError of either json backend
             print(f"[ERROR] Failed to parse JSON: {e}")
             print(f"[DEBUG] Response was: {response_text}")
             return {"name": "", "price": None, "error": "JSON parse error"}
     
+    def _parse_batch_response(self, response_text: str, k: int) -> list[dict] | None:
+        """Parse the JSON array of a batch response, None if it is not k objects"""
+        m = _CODE_BLOCK.search(response_text)
+        if m:
+            response_text = m.group(1).strip()
+        try:
+            result = jsonio.loads(response_text)
+        except ValueError as e:
+            print(f"[WARNING] Failed to parse batch JSON: {e}")
+            return None
+        if not isinstance(result, list) or len(result) != k or not all(isinstance(r, dict) for r in result):
+            print(f"[WARNING] Batch answer does not contain {k} objects")
+            return None
+        return [{"name": r.get("name", ""), "price": r.get("price")} for r in result]
+
+    async def _extract_all(self, image_files: list[Path], on_row=None) -> list[dict]:
+        """
+        Run extraction for all images, `batch_size` images per request and at most
+        `concurrency` requests in flight. Request starts are rate limited to one per
+        `rate_limit_delay` seconds. Rows are returned in the same order as `image_files`;
+        `on_row(row)` is called as soon as each one is ready (completion order).
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        limiter = _RateLimiter(self.rate_limit_delay)
+        rows: list[dict] = [{} for _ in image_files]
+
+        async def _call(fn, arg):
+            await limiter.acquire()
+            return await asyncio.to_thread(fn, arg)
+
+        async def _group(start: int) -> None:
+            paths = image_files[start:start + self.batch_size]
+            async with semaphore:
+                results = await _call(self.extract_batch, paths) if len(paths) > 1 else None
+                if results is None:
+                    results = [await _call(self.extract, p) for p in paths]
+            for idx, (image_path, result) in enumerate(zip(paths, results), start):
+                rows[idx] = _make_row(image_path, result)
+                if on_row is not None:
+                    on_row(rows[idx])
+
+        await asyncio.gather(*(_group(i) for i in range(0, len(image_files), self.batch_size)))
+        return rows
+
     def process_folder(
         self,
         crops_dir: Path,
         out_json: Path,
         out_csv: Path,
-        image_pattern: str = "*.jpg"
+        image_pattern: str = "*.jpg",
+        pretty: bool = True
     ) -> dict:
         """
         Process all images in a folder.
+        Rows are appended to <out_json stem>.jsonl as they arrive, so a crash keeps finished work.
         
         Args:
             crops_dir: Directory containing cropped product images
             out_json: Output JSON file path
             out_csv: Output CSV file path
             image_pattern: Glob pattern for images (default: *.jpg)
+            pretty: Also write the indented JSON array to out_json once all images are done
         
         Returns:
             Dictionary with processing statistics
         """
-        rows = []
-        image_files = sorted(crops_dir.glob(image_pattern))
+        image_files = sorted_files(crops_dir, image_pattern)
         
         if not image_files:
             print(f"[WARNING] No images found in {crops_dir} matching pattern {image_pattern}")
             return {"count": 0, "json": str(out_json), "csv": str(out_csv)}
         
-        print(f"\n[INFO] Found {len(image_files)} images to process\n")
-        
-        for idx, image_path in enumerate(image_files, 1):
-            print(f"[{idx}/{len(image_files)}] Processing {image_path.name}...")
-            
-            # Extract product info
-            result = self.extract(image_path)
-            
-            # Create row
-            row = {
-                "file": image_path.name,
-                "name_ocr": result.get("name", ""),
-                "price_raw": f"{result.get('price', '')}€".replace(".", ",") if result.get('price') else "",
-                "price_eur": result.get("price"),
-            }
-            
+        print(f"\n[INFO] Found {len(image_files)} images to process "
+              f"(concurrency={self.concurrency}, batch size={self.batch_size})\n")
+
+        out_json.parent.mkdir(parents=True, exist_ok=True)
+        out_jsonl = out_json.with_suffix(".jsonl")
+        with out_jsonl.open("wb") as f:
+            def _append(row: dict) -> None:
+                f.write(jsonio.dumps_line(row))
+                f.flush()
+            rows = asyncio.run(self._extract_all(image_files, on_row=_append))
+
+        for idx, row in enumerate(rows, 1):
             # Print results
+            print(f"[{idx}/{len(image_files)}] {row['file']}")
             print(f"  ✓ Name: {row['name_ocr'] or '(not found)'}")
             print(f"  ✓ Price: {row['price_eur']}€" if row['price_eur'] else "  ✗ Price: (not found)")
-            
-            rows.append(row)
-            
-            # Rate limiting (avoid hitting API limits)
-            if idx < len(image_files):  # Don't delay after last image
-                time.sleep(self.rate_limit_delay)
-        
+
         # Write JSON output
-        out_json.parent.mkdir(parents=True, exist_ok=True)
-        out_json.write_text(json.dumps(rows, ensure_ascii=False, indent=2), "utf-8")
+        if pretty:
+            jsonio.write_json(out_json, rows)
         
         # Write CSV output
         out_csv.parent.mkdir(parents=True, exist_ok=True)
-        with out_csv.open("w", newline="", encoding="utf-8") as f:
-            w = csv.DictWriter(f, fieldnames=["file", "name_ocr", "price_raw", "price_eur"])
-            w.writeheader()
-            w.writerows(rows)
+        _write_csv(rows, out_csv)
         
         # Print summary
         print(f"\n{'='*60}")
         print(f"[SUCCESS] Processed {len(rows)} images")
-        print(f"[SUCCESS] JSON saved to: {out_json}")
+        print(f"[SUCCESS] JSONL saved to: {out_jsonl}")
+        if pretty:
+            print(f"[SUCCESS] JSON saved to: {out_json}")
         print(f"[SUCCESS] CSV saved to: {out_csv}")
         
         # Statistics
@@ -176,7 +288,8 @@ Image with pasta and "1,29*" → {"name": "Combino Fusilli XXL", "price": 1.29}"
         
         return {
             "count": len(rows),
-            "json": str(out_json),
+            "json": str(out_json) if pretty else None,
+            "jsonl": str(out_jsonl),
             "csv": str(out_csv),
             "stats": {
                 "names_found": found_names,
@@ -185,6 +298,32 @@ Image with pasta and "1,29*" → {"name": "Combino Fusilli XXL", "price": 1.29}"
         }
     
 
+def _make_row(image_path: Path, result: dict) -> dict:
+    """One output row (JSON/CSV) from an `extract` result"""
+    return {
+        "file": image_path.name,
+        "name_ocr": result.get("name", ""),
+        "price_raw": f"{result.get('price', '')}€".replace(".", ",") if result.get('price') else "",
+        "price_eur": result.get("price"),
+    }
+
+def _write_csv(rows: list[dict], out_csv: Path) -> None:
+    """Write OCR rows as CSV; columnar pyarrow writer when available, else csv.DictWriter"""
+    if pa is not None:
+        try:
+            table = pa.Table.from_pylist(rows, schema=pa.schema([
+                ("file", pa.string()), ("name_ocr", pa.string()),
+                ("price_raw", pa.string()), ("price_eur", pa.float64()),
+            ]))
+            pacsv.write_csv(table, str(out_csv), pacsv.WriteOptions(quoting_style="needed"))
+            return
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            pass  # e.g. the model returned a price as a string; let DictWriter handle it
+    with out_csv.open("w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+        w.writeheader()
+        w.writerows(rows)
+
 def ocr_folder(crops_dir: Path, out_json: Path, out_csv: Path) -> dict:
     """
    Drop-in replacement for the old OCR entrypoint.
@@ -199,6 +338,8 @@ def ocr_folder(crops_dir: Path, out_json: Path, out_csv: Path) -> dict:
         api_key=api_key,
         model=os.getenv("GEMINI_MODEL", GEN_DEFAULT), 
         rate_limit_delay=float(os.getenv("GEMINI_RATE_DELAY", "0.5")),
+        concurrency=int(os.getenv("GEMINI_CONCURRENCY", str(CONCURRENCY_DEFAULT))),
+        batch_size=int(os.getenv("GEMINI_BATCH_SIZE", str(BATCH_SIZE_DEFAULT))),
     )
 
     return extractor.process_folder(crops_dir=crops_dir, out_json=out_json, out_csv=out_csv)
@@ -1,31 +1,73 @@
-import os, sys, json, time, uuid, subprocess
-from datetime import datetime, timedelta
+import os, sys, tempfile, time, uuid, subprocess
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from functools import lru_cache
 from pathlib import Path
-from PIL import Image
-from ultralytics import YOLO
+import cv2
+import numpy as np
+from app.detector import get_yolo
+from app.files import sorted_files
 from app.ocr import ocr_folder
+from app.jsonio import write_json
 
 
 #  Directory to save inference results (images with boxes, labels, etc.)
 RUNS_DIR = Path(os.getenv("RUNS_DIR", "static/runs")).resolve()
 DATA_ORIGINALS = Path(os.getenv("DATA_ORIGINALS", "static")).resolve()
-MODEL_PATH = "models/best.onnx"
-
-class YoloService:
-    def __init__(self, conf: float = 0.25):
-        self.conf = conf
-        self.model = YOLO(MODEL_PATH)
-        self.model.task = "detect"
-    
-    def predict_pil(self, img: Image.Image, conf: float | None = None):
-        results = self.model(img, conf=self.conf if conf is None else conf)
-        dets = []
-        for r in results:
-            if r.boxes is None: continue
-            for b in r.boxes:
-                x1,y1,x2,y2 = map(int, b.xyxy[0].tolist())
-                dets.append({"class_id": int(b.cls), "score": float(b.conf), "box": [x1,y1,x2,y2]})
-        return dets
+# set SCRAPE_SUBPROCESS=1 to run scrape.py as a child process instead of in-process
+SCRAPE_SUBPROCESS = os.getenv("SCRAPE_SUBPROCESS", "0") == "1"
+
+try:
+    # libjpeg-turbo SIMD decode/encode; optional, OpenCV is used otherwise
+    from turbojpeg import TurboJPEG, TJPF_BGR
+    _TJ = TurboJPEG()
+except (ImportError, RuntimeError, OSError):
+    _TJ = None
+
+def _read_bgr(path: Path) -> np.ndarray:
+    """Decode a JPEG page into an (H, W, 3) BGR uint8 array"""
+    if _TJ is not None:
+        return _TJ.decode(path.read_bytes(), pixel_format=TJPF_BGR)
+    return cv2.imread(str(path), cv2.IMREAD_COLOR)
+
+def _encode_jpeg(arr: np.ndarray, quality: int = 90) -> bytes:
+    """Encode a BGR array (or a view of one) as JPEG bytes"""
+    if _TJ is not None:
+        return _TJ.encode(np.ascontiguousarray(arr), quality=quality, pixel_format=TJPF_BGR)
+    ok, buf = cv2.imencode(".jpg", arr, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise RuntimeError("JPEG encoding failed")
+    return buf.tobytes()
+
+def _model_input(page_path: Path, page: np.ndarray, imgsz: int) -> np.ndarray:
+    """
+    Page resized so its long side is `imgsz`, memoized as <stem>_<imgsz>.npy next to the JPEG
+    so YOLO's letterbox skips the resize. The cache is rebuilt when the JPEG is newer
+    (a week folder was re-scraped).
+    """
+    cache = page_path.with_name(f"{page_path.stem}_{imgsz}.npy")
+    try:
+        if cache.stat().st_mtime_ns >= page_path.stat().st_mtime_ns:
+            return np.load(cache, mmap_mode="r")
+    except (OSError, ValueError):  # missing, or unreadable leftover
+        pass
+    h, w = page.shape[:2]
+    r = min(imgsz / h, imgsz / w)
+    small = cv2.resize(page, (round(w * r), round(h * r)), interpolation=cv2.INTER_LINEAR)
+    # written under a temp name and renamed, so a concurrent run never loads a partial array
+    fd, tmp = tempfile.mkstemp(dir=page_path.parent, prefix=cache.stem, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, small)
+        os.replace(tmp, cache)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return small
+
+def _save_crop(task: tuple[np.ndarray, Path]) -> None:
+    crop, outp = task
+    outp.write_bytes(_encode_jpeg(crop, quality=90))
 
 def _new_run_dir() -> Path:
     """Create a new unique run directory and return its Path"""
@@ -34,40 +76,49 @@ def _new_run_dir() -> Path:
     (rd / "crops").mkdir(parents=True, exist_ok=True)
     return rd
 
-def _get_this_week_monday() -> str:
-    """Get the date string (YYYY-MM-DD) for this week's Monday"""
-    today = datetime.now()
-    monday = today - timedelta(days=today.weekday())
-    return monday.strftime("%Y-%m-%d")
+@lru_cache(maxsize=4)
+def _week_range(iso_key: tuple[int, int]) -> tuple[str, str]:
+    """(Monday, Saturday) date strings (YYYY-MM-DD) of the given ISO (year, week)"""
+    year, week = iso_key
+    monday = date.fromisocalendar(year, week, 1)
+    saturday = monday + timedelta(days=5)
+    return monday.strftime("%Y-%m-%d"), saturday.strftime("%Y-%m-%d")
 
-def _get_this_week_saturday() -> str:
-    """Get the date string (YYYY-MM-DD) for this week's Saturday"""
-    today = datetime.now()
-    saturday = today + timedelta((5 - today.weekday()) % 7)
-    return saturday.strftime("%Y-%m-%d")
+def this_week() -> tuple[str, str]:
+    """(Monday, Saturday) of the current week; rolls over at midnight on Monday"""
+    return _week_range(tuple(date.today().isocalendar()[:2]))
 
-THIS_MONDAY = _get_this_week_monday()
-THIS_SATURDAY = _get_this_week_saturday()
+# (pages dir, week monday) pairs already known to hold this week's pages.
+# Only hits are cached: a miss triggers the scraper, after which the next probe hits.
+_SCRAPED_WEEKS: set[tuple[str, str]] = set()
 
 def _scraped_dir_exists(directory_to_check: Path) -> bool:
     """Check if the scraped pages directory contains this week's scraped images."""
-    for d in directory_to_check.iterdir():
-        if d.is_dir() and d.name.startswith(THIS_MONDAY):
-            jpg_files = list(d.glob("*.jpg"))
-            if len(jpg_files) > 0:
-                return True
+    monday, saturday = this_week()
+    key = (str(directory_to_check), monday)
+    if key in _SCRAPED_WEEKS:
+        return True
+    target = directory_to_check / f"{monday}_{saturday}"
+    if target.is_dir() and next(target.glob("*.jpg"), None) is not None:
+        _SCRAPED_WEEKS.add(key)
+        return True
     return False
 
 def _try_call_scraper(site: str, out_dir: Path, num_prospekt: int) -> bool:
-    """Call the scraper subprocess to download images if not already done for this week."""
-    cmd = [sys.executable, "scrape.py",
-           "--site", site,
-           "--download-path", str(out_dir),
-           "--num_prospekt", str(num_prospekt)]
+    """Run the scraper to download images if not already done for this week."""
     try:
-        if not _scraped_dir_exists(out_dir):
+        if _scraped_dir_exists(out_dir):
+            return True
+        if SCRAPE_SUBPROCESS:
+            # isolated from the API process, e.g. if Chrome crashes are a concern
+            cmd = [sys.executable, "scrape.py",
+                   "--site", site,
+                   "--download-path", str(out_dir),
+                   "--num_prospekt", str(num_prospekt)]
             subprocess.run(cmd, check=True)
-        return True
+            return True
+        from scrape import run as _scrape_run  # lazy: pulls in selenium
+        return _scrape_run(site=site, download_path=str(out_dir), num_prospekt=num_prospekt)['success']
     except Exception:
         
         return False
@@ -81,18 +132,22 @@ def run_once(site: str = "lidl", conf: float = 0.25, num_prospekt: int = 1) -> d
     _try_call_scraper(site, pages_dir, num_prospekt)
 
     # 2) Run YOLO and save crops
-    yolo = YoloService(conf=conf)
+    yolo = get_yolo()  # conf is passed per call, the shared instance is not mutated
     items = []
-    pages_dir = pages_dir / f"{THIS_MONDAY}_{THIS_SATURDAY}"  # only this week's pages
-    for i, page_path in enumerate(sorted(pages_dir.glob("*.jpg")), 1):
-        img = Image.open(page_path).convert("RGB")
-        dets = yolo.predict_pil(img, conf=conf)
+    monday, saturday = this_week()
+    pages_dir = pages_dir / f"{monday}_{saturday}"  # only this week's pages
+    page_paths = sorted_files(pages_dir, "*.jpg") if pages_dir.is_dir() else []
+    imgs = [_read_bgr(p) for p in page_paths]  # decoded once per page, full size for crops
+    inputs = [_model_input(p, img, yolo.imgsz) for p, img in zip(page_paths, imgs)]
+    # boxes are mapped back to full-size page pixels
+    all_dets = yolo.predict_batch(inputs, conf=conf, orig_shapes=[img.shape[:2] for img in imgs])
+    encode_tasks = []
+    for i, (img, dets) in enumerate(zip(imgs, all_dets), 1):
         for j, d in enumerate(dets, 1):
             x1, y1, x2, y2 = d["box"]
-            crop = img.crop((x1, y1, x2, y2))
+            crop = img[y1:y2, x1:x2]  # view, no copy
             name = f"p{i:02d}_b{j:03d}.jpg"
-            outp = crops_dir / name
-            crop.save(outp, "JPEG", quality=90)
+            encode_tasks.append((crop, crops_dir / name))
             items.append({
                 "page": i,
                 "file": f"/static/runs/{run_dir.name}/crops/{name}",
@@ -101,12 +156,16 @@ def run_once(site: str = "lidl", conf: float = 0.25, num_prospekt: int = 1) -> d
                 "box": d["box"]
             })
 
-     # NEW: OCR over crops
+    # JPEG encoders release the GIL, so crops encode in parallel
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as ex:
+        list(ex.map(_save_crop, encode_tasks))
+
+    # NEW: OCR over crops
     ocr_json = run_dir / "ocr.json"
     ocr_csv  = run_dir / "ocr.csv"
     ocr_info = ocr_folder(crops_dir, ocr_json, ocr_csv)
 
     meta = {"run_id": run_dir.name, "site": site, "count": len(items), "items": items,
             "ocr": ocr_info}
-    (run_dir / "meta.json").write_text(json.dumps(meta, ensure_ascii=False, indent=2), "utf-8")
+    write_json(run_dir / "meta.json", meta)
     return meta
@@ -1,13 +1,20 @@
 from pathlib import Path
-import random
+import re
 from ultralytics import YOLO
 import torch
 import argparse
+import csv
+import hashlib
+import json
 import os
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 import cv2
+import numpy as np
 from datetime import datetime
 
+IMG_EXTS = {'.png', '.jpg', '.jpeg', '.bmp', '.tiff', '.webp'}
+
 def main():
     parser = argparse.ArgumentParser(description="YOLOv11 Training Model")
     parser.add_argument("--config", type=str, default="configs/dataset.yaml", help="Path to dataset config file")
@@ -16,6 +23,8 @@ def main():
     parser.add_argument("--image_size", type=int, default=640, choices=[320, 640, 1280], help="Image size")
     parser.add_argument("--batch_size", type=int, default=16, help="Batch size")
     parser.add_argument("--test_grouping", action="store_true", help="Test grouping after training")
+    parser.add_argument("--cache", type=str, default="none", choices=["ram", "disk", "none"], help="Cache decoded training images in RAM or as .npy next to the images")
+    parser.add_argument("--channels_last", action="store_true", help="Train in channels-last (NHWC) memory format on CUDA (pairs with AMP)")
     parser.add_argument("--name", type=str, default="latest_yolo_run", help="Name of the training run")
     
     # Evaluation parameters
@@ -23,11 +32,19 @@ def main():
     parser.add_argument("--eval_model", type=str, default="runs/detect/latest_yolo_run/weights/best.pt", help="Path to trained model for evaluation")
     parser.add_argument("--eval_data", type=str, help="Path to folder containing images for evaluation")
     parser.add_argument("--eval_conf", type=float, default=0.25, help="Confidence threshold for evaluation")
+    parser.add_argument("--eval_batch", type=int, default=16, help="Number of images per inference batch during evaluation")
+    parser.add_argument("--compile", action="store_true", help="Run evaluation through torch.compile (reduce-overhead mode), .pt models only")
+    parser.add_argument("--crop_format", type=str, default="jpg", choices=["jpg", "png"], help="Image format for evaluation crops and annotated pages (png is lossless)")
+    parser.add_argument("--trt", action="store_true", help="Evaluate with a TensorRT engine exported from --eval_model")
+    parser.add_argument("--precision", type=str, default="fp16", choices=["fp32", "fp16", "int8"], help="TensorRT engine precision (with --trt); int8 calibrates on images from --config")
     
     # Dataset split parameters
     parser.add_argument("--train_ratio", type=float, default=0.8, help="Ratio of training data (default: 0.8)")
     parser.add_argument("--val_ratio", type=float, default=0.1, help="Ratio of validation data (default: 0.1)")
     parser.add_argument("--test_ratio", type=float, default=0.1, help="Ratio of test data (default: 0.1)")
+    parser.add_argument("--image_format", type=str, default="png", choices=["png", "webp"], help="Format of the prepared split images; webp re-encodes losslessly for faster decoding")
+    parser.add_argument("--split_seed", type=int, default=0, help="Random seed for the train/val/test split (default: 0)")
+    parser.add_argument("--link_mode", type=str, default="hardlink", choices=["hardlink", "symlink", "copy"], help="How images are placed into the split folders (default: hardlink)")
 
     # Additional training parameters
     parser.add_argument("--lr", type=float, default=0.01, help="Learning rate for training")
@@ -51,14 +68,30 @@ def main():
             # Default to test set if no specific data provided
             raise ValueError("--eval_data is required when using evaluation mode")
         
-        evaluate_model(args.eval_model, args.eval_data, args.eval_conf)
+        if args.trt and args.compile:
+            raise ValueError("--compile only applies to .pt models and can't be combined with --trt")
+        
+        eval_model = args.eval_model
+        if args.trt:
+            eval_model = export_trt_engine(args.eval_model, batch_size=args.eval_batch,
+                                           precision=args.precision, data=args.config)
+        evaluate_model(eval_model, args.eval_data, args.eval_conf, args.eval_batch, args.crop_format, args.compile)
         return
 
     # Prepare dataset from all week folders
-    prepare_global_dataset(args.train_ratio, args.val_ratio, args.test_ratio)
+    prepare_global_dataset(args.train_ratio, args.val_ratio, args.test_ratio, args.link_mode, args.split_seed,
+                           args.image_format)
+
+    # Training batches are fixed-size, let cuDNN pick the fastest conv kernels.
+    # Left off for AutoBatch (batch -1), which refuses to run with benchmark mode.
+    if torch.cuda.is_available() and args.batch_size > 0:
+        torch.backends.cudnn.benchmark = True
 
     # Load pretrained model
     model = YOLO("yolo11m.pt")
+    if args.channels_last and torch.cuda.is_available():
+        # The trainer builds its own copy of the network, so convert that one once it is set up
+        model.add_callback("on_pretrain_routine_end", to_channels_last)
 
     # Start training
     results = model.train(
@@ -71,19 +104,74 @@ def main():
         save=True,
         save_period=args.save_period,
         workers=args.num_workers,
+        # Ultralytics checks free RAM/disk itself and falls back to no caching
+        cache=False if args.cache == "none" else args.cache,
         lr0=args.lr,
         momentum=args.momentum,
         weight_decay=args.weight_decay,
         project=args.save_dir,
         name=args.name,
         exist_ok=True,
+        amp=True,
     )
     
     print("Training completed!")
     best_model_path = os.path.join(args.save_dir, args.name, 'weights', 'best.pt')
     print(f"Best model saved at: {best_model_path}")
 
-def evaluate_model(model_path = "runs/detect/latest_yolo_run/weights/best.pt", data_path="", conf_threshold=0.25):
+def export_trt_engine(pt_path, imgsz=640, batch_size=16, precision="fp16", data="configs/dataset.yaml"):
+    """
+    Export a .pt model to a TensorRT engine saved next to it (best.engine for FP16,
+    best_fp32.engine / best_int8.engine otherwise).
+    The engine is reused as long as it is newer than the .pt.
+    FP16 needs no calibration data. INT8 is calibrated on images sampled from the
+    dataset config; without a representative calibration set accuracy drops noticeably.
+    
+    Args:
+        pt_path (str): Path to the trained .pt model
+        imgsz (int): Inference image size baked into the engine
+        batch_size (int): Largest batch the engine accepts (dynamic batch)
+        precision (str): One of "fp32", "fp16", "int8"
+        data (str): Dataset config used for INT8 calibration
+        
+    Returns:
+        str: Path to the engine, or pt_path unchanged if it is not a .pt file
+    """
+    pt_path = Path(pt_path)
+    if pt_path.suffix != ".pt":
+        return str(pt_path)
+    suffix = "" if precision == "fp16" else f"_{precision}"
+    engine_path = pt_path.with_name(f"{pt_path.stem}{suffix}.engine")
+    if engine_path.exists() and engine_path.stat().st_mtime >= pt_path.stat().st_mtime:
+        print(f"Using cached TensorRT engine: {engine_path}")
+        return str(engine_path)
+
+    print(f"Exporting TensorRT {precision.upper()} engine from: {pt_path}")
+    if precision == "int8":
+        print("Warning: INT8 accuracy depends on a representative calibration set "
+              f"(images are taken from '{data}')")
+    exported = YOLO(str(pt_path)).export(
+        format="engine", imgsz=imgsz, device=0, dynamic=True, batch=batch_size,
+        half=precision == "fp16", int8=precision == "int8",
+        data=data if precision == "int8" else None,
+    )
+    # Ultralytics always writes <stem>.engine, keep one file per precision
+    if Path(exported) != engine_path:
+        Path(exported).replace(engine_path)
+    return str(engine_path)
+
+def to_channels_last(trainer):
+    """
+    Ultralytics callback: switch the training model to channels-last memory format.
+    The EMA copy (the model that is validated and saved) already exists at this point,
+    so it is converted as well.
+    """
+    trainer.model.to(memory_format=torch.channels_last)
+    if getattr(trainer, "ema", None) is not None:
+        trainer.ema.ema.to(memory_format=torch.channels_last)
+    print("Training and EMA models converted to channels-last memory format")
+
+def evaluate_model(model_path = "runs/detect/latest_yolo_run/weights/best.pt", data_path="", conf_threshold=0.25, batch_size=16, image_format="jpg", compile_model=False):
     """
     Evaluate a trained YOLO model on images and save results.
     
@@ -91,6 +179,10 @@ def evaluate_model(model_path = "runs/detect/latest_yolo_run/weights/best.pt", d
         model_path (str): Path to the trained model
         data_path (str): Path to folder containing images for evaluation
         conf_threshold (float): Confidence threshold for detections
+        batch_size (int): Number of images per inference batch
+        image_format (str): "jpg" (quality 90) or "png" for crops and annotated images
+        compile_model (bool): Compile the PyTorch model with torch.compile before inference
+            (.pt models only, ignored for exported formats)
     """
     print(f"Loading model from: {model_path}")
     model = YOLO(model_path)
@@ -107,110 +199,109 @@ def evaluate_model(model_path = "runs/detect/latest_yolo_run/weights/best.pt", d
     crops_dir = eval_results_dir / "crops"
     crops_dir.mkdir(exist_ok=True)
     
-    # Get all image files
-    image_extensions = ['*.png', '*.jpg', '*.jpeg', '*.bmp', '*.tiff']
-    image_files = []
-    for ext in image_extensions:
-        image_files.extend(data_dir.glob(ext))
+    # Get all image files in one directory pass
+    with os.scandir(data_dir) as it:
+        image_files = sorted(Path(e.path) for e in it
+                             if os.path.splitext(e.name)[1].lower() in IMG_EXTS and e.is_file())
     
     if not image_files:
         raise ValueError(f"No image files found in '{data_path}'")
     
     print(f"Found {len(image_files)} images for evaluation")
     
+    # FP16 on GPU, CPU inference stays FP32
+    predict_kwargs = {"conf": conf_threshold, "half": torch.cuda.is_available()}
+    if compile_model and Path(model_path).suffix == ".pt":
+        # Ultralytics compiles once when the predictor is set up and warms up before the first batch
+        predict_kwargs["compile"] = "reduce-overhead"
+    elif compile_model:
+        print(f"Warning: torch.compile only applies to .pt models, running {model_path} without it")
+
     # Initialize results storage
     all_detections = []
     results_txt_path = eval_results_dir / "detections.txt"
     crop_counter = 0  # Global counter for unique crop naming
+    # cv2.imwrite releases the GIL, so encodes overlap with inference of the next batch
+    write_pool = ThreadPoolExecutor(max_workers=os.cpu_count())
+    write_params = [cv2.IMWRITE_JPEG_QUALITY, 90] if image_format == "jpg" else []
 
     
-    # Process each image
-    for i, img_path in enumerate(image_files):
+    # Process each image, inference runs batch_size images per forward pass
+    for i, (img_path, result) in enumerate(predict_batched(model, image_files, batch_size, **predict_kwargs)):
         print(f"Processing {i+1}/{len(image_files)}: {img_path.name}")
         
-        # Run inference
-        results = model(str(img_path), conf=conf_threshold)
-        
-        # Load original image for drawing
-        img = cv2.imread(str(img_path))
+        # Reuse the BGR image YOLO already decoded instead of reading the file again
+        img = result.orig_img
         if img is None:
             print(f"Warning: Could not load image {img_path}")
             continue
         
         img_height, img_width = img.shape[:2]
-        img_for_crops = img.copy()  # Use this for cropping, keep 'img' for drawing
 
         # Process detections
         image_detections = []
-        for result in results:
-            boxes = result.boxes
-            if boxes is not None:
-                for j in range(len(boxes)):
-                    # Get detection info
-                    class_id = int(boxes.cls[j])
-                    confidence = float(boxes.conf[j])
-                    
-                    # Get bounding box coordinates (xyxy format)
-                    x1, y1, x2, y2 = boxes.xyxy[j].cpu().numpy()
-                    x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
-                    
-                    # Get normalized coordinates (xywhn format)
-                    x_center_norm = float(boxes.xywhn[j][0])
-                    y_center_norm = float(boxes.xywhn[j][1])
-                    width_norm = float(boxes.xywhn[j][2])
-                    height_norm = float(boxes.xywhn[j][3])
-                    
-                    # Crop the detected product
-                    crop_counter += 1
-                    crop_filename = f"crop{crop_counter:03d}_{img_path.stem}.png"
-                    crop_path = crops_dir / crop_filename
-                    
-                    # Ensure coordinates are within image bounds
-                    x1_crop = max(0, x1)
-                    y1_crop = max(0, y1)
-                    x2_crop = min(img_width, x2)
-                    y2_crop = min(img_height, y2)
-                    
-                    if x2_crop > x1_crop and y2_crop > y1_crop:
-                        cropped_img = img_for_crops[y1_crop:y2_crop, x1_crop:x2_crop]
-                        cv2.imwrite(str(crop_path), cropped_img)
-                        print(f"    Saved crop: {crop_filename}")
-                    
-                    # Store detection info
-                    detection_info = {
-                        'image_name': img_path.name,
-                        'image_width': img_width,
-                        'image_height': img_height,
-                        'class_id': class_id,
-                        'confidence': confidence,
-                        'x1': x1, 'y1': y1, 'x2': x2, 'y2': y2,  # Absolute coordinates
-                        'x_center_norm': x_center_norm,
-                        'y_center_norm': y_center_norm,
-                        'width_norm': width_norm,
-                        'height_norm': height_norm,
-                        'crop_filename': crop_filename  # Add crop filename to detection info
-                    }
-                    
-                    image_detections.append(detection_info)
-                    all_detections.append(detection_info)
-                    
-                    # Draw bounding box on image
-                    cv2.rectangle(img, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                    
-                    # Add label with confidence
-                    label = f"Product: {confidence:.2f}"
-                    label_size = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 1)[0]
-                    cv2.rectangle(img, (x1, y1 - label_size[1] - 10), 
-                                (x1 + label_size[0], y1), (0, 255, 0), -1)
-                    cv2.putText(img, label, (x1, y1 - 5), 
-                              cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 1)
-        
-        # Save image with detections
-        output_img_path = eval_results_dir / f"detected_{img_path.name}"
-        cv2.imwrite(str(output_img_path), img)
+        boxes = result.boxes
+        if boxes is not None and len(boxes):
+            # One device->host transfer per tensor instead of one per detection
+            class_ids = boxes.cls.cpu().numpy().astype(int)
+            confidences = boxes.conf.cpu().numpy()
+            xyxy = boxes.xyxy.cpu().numpy().astype(int)
+            xywhn = boxes.xywhn.cpu().numpy()
+            # Crop coordinates clipped to image bounds
+            xyxy_crop = xyxy.copy()
+            xyxy_crop[:, [0, 2]] = np.clip(xyxy_crop[:, [0, 2]], 0, img_width)
+            xyxy_crop[:, [1, 3]] = np.clip(xyxy_crop[:, [1, 3]], 0, img_height)
+
+            for j in range(len(boxes)):
+                # Get detection info
+                class_id = int(class_ids[j])
+                confidence = float(confidences[j])
+                
+                # Get bounding box coordinates (xyxy format)
+                x1, y1, x2, y2 = xyxy[j].tolist()
+                
+                # Get normalized coordinates (xywhn format)
+                x_center_norm, y_center_norm, width_norm, height_norm = xywhn[j].tolist()
+                
+                # Crop the detected product
+                crop_counter += 1
+                crop_filename = f"crop{crop_counter:03d}_{img_path.stem}.{image_format}"
+                crop_path = crops_dir / crop_filename
+                
+                x1_crop, y1_crop, x2_crop, y2_crop = xyxy_crop[j].tolist()
+                
+                if x2_crop > x1_crop and y2_crop > y1_crop:
+                    # View into the page; result.plot() draws on its own copy, so img stays clean
+                    cropped_img = img[y1_crop:y2_crop, x1_crop:x2_crop]
+                    write_pool.submit(cv2.imwrite, str(crop_path), cropped_img, write_params)
+                    print(f"    Saved crop: {crop_filename}")
+                
+                # Store detection info
+                detection_info = {
+                    'image_name': img_path.name,
+                    'image_width': img_width,
+                    'image_height': img_height,
+                    'class_id': class_id,
+                    'confidence': confidence,
+                    'x1': x1, 'y1': y1, 'x2': x2, 'y2': y2,  # Absolute coordinates
+                    'x_center_norm': x_center_norm,
+                    'y_center_norm': y_center_norm,
+                    'width_norm': width_norm,
+                    'height_norm': height_norm,
+                    'crop_filename': crop_filename  # Add crop filename to detection info
+                }
+                
+                image_detections.append(detection_info)
+                all_detections.append(detection_info)
+    
+        # Save image with detections (boxes and "Product 0.87" labels drawn by Ultralytics)
+        output_img_path = eval_results_dir / f"detected_{img_path.stem}.{image_format}"
+        write_pool.submit(cv2.imwrite, str(output_img_path), result.plot(conf=True, labels=True), write_params)
         
         print(f"  Found {len(image_detections)} detections")
     
+    write_pool.shutdown(wait=True)
+
     # Save detections to text file
     save_detections_to_txt(results_txt_path, model_path, data_path, conf_threshold, image_files, all_detections)
 
@@ -218,7 +309,19 @@ def evaluate_model(model_path = "runs/detect/latest_yolo_run/weights/best.pt", d
     summary_path = eval_results_dir / "summary.txt"
     write_evaluation_summary(summary_path, model_path, data_path, conf_threshold, image_files, all_detections)
 
-def prepare_global_dataset(train_ratio, val_ratio, test_ratio):
+def predict_batched(model, image_files, batch_size, **predict_kwargs):
+    """
+    Run the model on image files in chunks of batch_size, one forward pass per chunk.
+    
+    Yields:
+        tuple: (image path, Ultralytics result) in the order of image_files
+    """
+    for start in range(0, len(image_files), batch_size):
+        chunk = image_files[start:start + batch_size]
+        results = model([str(p) for p in chunk], **predict_kwargs)
+        yield from zip(chunk, results)
+
+def prepare_global_dataset(train_ratio, val_ratio, test_ratio, link_mode="hardlink", split_seed=0, image_format="png"):
     """
     Aggregate all data from week folders and create global train/val/test split.
     Only class 5 (Product) labels are kept and converted to class 0.
@@ -227,6 +330,10 @@ def prepare_global_dataset(train_ratio, val_ratio, test_ratio):
         train_ratio (float): Ratio of training data
         val_ratio (float): Ratio of validation data  
         test_ratio (float): Ratio of test data
+        link_mode (str): "hardlink", "symlink" or "copy", see link_or_copy
+        split_seed (int): Seed for the split, the same seed and sources give the same split
+        image_format (str): "png" places the source files as-is, "webp" re-encodes them
+            losslessly (decodes faster every epoch)
     """
     print("Preparing global dataset...")
     
@@ -234,20 +341,19 @@ def prepare_global_dataset(train_ratio, val_ratio, test_ratio):
     if not originals_dir.exists():
         raise FileNotFoundError(f"Directory '{originals_dir}' does not exist.")
     
-    # Collect all image-label pairs from all week folders
-    all_image_label_pairs = []
+    # Collect all image-label candidates from all week folders, grouped per week
+    week_candidates = []
     
     # Find all subdirectories (lidl, netto, etc.)
-    subdirectories = [d for d in originals_dir.iterdir() if d.is_dir()]
+    with os.scandir(originals_dir) as it:
+        subdirectories = [Path(e.path) for e in it if e.is_dir()]
 
     print(f"Found {len(subdirectories)} subdirectories: {subdirectories}")
 
     for subdir in subdirectories:
         # Find all week folders (without _labels suffix)
-        week_folders = [
-            name for name in os.listdir(subdir) 
-            if subdir.joinpath(name).is_dir() and not name.endswith("_labels")
-        ]
+        with os.scandir(subdir) as it:
+            week_folders = [e.name for e in it if e.is_dir() and not e.name.endswith("_labels")]
         
         print(f"Found {len(week_folders)} week folders in '{subdir.name}': {week_folders}")
         
@@ -264,63 +370,92 @@ def prepare_global_dataset(train_ratio, val_ratio, test_ratio):
                 continue
             
             # Get all PNG images in the week folder
-            images = list(week_path.glob("*.png"))
+            with os.scandir(week_path) as it:
+                images = [Path(e.path) for e in it if e.name.endswith(".png") and e.is_file()]
             print(f"Week {week}: Found {len(images)} images")
             
             # Check for corresponding labels
-            valid_pairs = 0
+            candidates = []
             for img_path in images:
                 label_path = labels_path / f"{img_path.stem}.txt"
                 if label_path.exists():
-                    # Check if the label file contains class 5 (Product)
-                    if has_product_class(label_path):
-                        all_image_label_pairs.append((img_path, label_path))
-                        valid_pairs += 1
-            
-            print(f"Week {week}: {valid_pairs} valid image-label pairs with Product class")
+                    candidates.append((img_path, label_path))
+            week_candidates.append((week, candidates))
+
+    # Skip the whole preparation if sources and settings match the last run
+    data_dir = Path("data")
+    manifest_path = data_dir / ".manifest.json"
+    settings = {"train_ratio": train_ratio, "val_ratio": val_ratio, "test_ratio": test_ratio,
+                "link_mode": link_mode, "split_seed": split_seed, "image_format": image_format}
+    fingerprint = dataset_fingerprint([pair for _, pairs in week_candidates for pair in pairs], settings)
+    previous_manifest = {}
+    if manifest_path.exists():
+        try:
+            previous_manifest = json.loads(manifest_path.read_text())
+        except (OSError, ValueError) as e:
+            print(f"Warning: Could not read dataset manifest {manifest_path}: {e}")
+    if previous_manifest.get("fingerprint") == fingerprint and (data_dir / "train" / "images").is_dir():
+        print("Dataset unchanged since last preparation, skipping.")
+        return
+
+    all_image_label_pairs = []
+    for week, candidates in week_candidates:
+        valid_pairs = 0
+        for img_path, label_path in candidates:
+            # Keep the pair only if the label file contains class 5 (Product);
+            # the converted labels are kept so the copy phase does not re-read them
+            product_labels = read_product_lines(label_path)
+            if product_labels is not None:
+                all_image_label_pairs.append((img_path, label_path, product_labels))
+                valid_pairs += 1
+        
+        print(f"Week {week}: {valid_pairs} valid image-label pairs with Product class")
     
     if not all_image_label_pairs:
         raise ValueError("No valid image-label pairs found with Product class (class 5)")
     
     print(f"Total valid image-label pairs: {len(all_image_label_pairs)}")
     
-    # Shuffle and split the data
-    random.shuffle(all_image_label_pairs)
-    
-    total_samples = len(all_image_label_pairs)
-    train_end = int(train_ratio * total_samples)
-    val_end = train_end + int(val_ratio * total_samples)
+    # Shuffle and split the data per store (lidl, netto, ...) so every split gets
+    # each store in proportion; seeded so the split is reproducible
+    rng = np.random.default_rng(split_seed)
+    by_store = {}
+    for pair in sorted(all_image_label_pairs, key=lambda p: str(p[0])):
+        by_store.setdefault(pair[0].parent.parent.name, []).append(pair)
     
-    train_pairs = all_image_label_pairs[:train_end]
-    val_pairs = all_image_label_pairs[train_end:val_end]
-    test_pairs = all_image_label_pairs[val_end:]
+    train_pairs, val_pairs, test_pairs = [], [], []
+    for store in sorted(by_store):
+        store_pairs = by_store[store]
+        order = rng.permutation(len(store_pairs))
+        train_end = int(train_ratio * len(store_pairs))
+        val_end = train_end + int(val_ratio * len(store_pairs))
+        train_pairs.extend(store_pairs[k] for k in order[:train_end])
+        val_pairs.extend(store_pairs[k] for k in order[train_end:val_end])
+        test_pairs.extend(store_pairs[k] for k in order[val_end:])
     
     print(f"Dataset split: Train={len(train_pairs)}, Val={len(val_pairs)}, Test={len(test_pairs)}")
     
+    # Remove the files placed by the previous preparation (listed in its manifest) so files of
+    # an old split or format don't linger; anything else in the split folders is left alone
+    removed = remove_manifest_files(data_dir, previous_manifest.get("files", []))
+    if removed:
+        print(f"Removed {removed} files of the previous preparation")
+
     # Create output directories
-    data_dir = Path("data")
     for split in ["train", "val", "test"]:
         for subdir in ["images", "labels"]:
             output_dir = data_dir / split / subdir
             output_dir.mkdir(parents=True, exist_ok=True)
     
-    # Copy files to respective directories
+    # Copy files to respective directories, pairs are independent so they run in parallel
+    tasks = []
     for split_name, pairs in [("train", train_pairs), ("val", val_pairs), ("test", test_pairs)]:
         print(f"Copying {len(pairs)} files to {split_name} set...")
-        
-        for img_path, label_path in pairs:
-            # Make unique filename by prefixing with week folder name
-            week_prefix = img_path.parent.name  # e.g., '2025-06-09_2025-06-15'
-            unique_img_name = f"{week_prefix}_{img_path.name}"
-            unique_label_name = f"{week_prefix}_{label_path.name}"
-
-            # Copy image
-            img_dest = data_dir / split_name / "images" / unique_img_name
-            shutil.copy2(img_path, img_dest)
-
-            # Process and copy label (filter only class 5 and convert to class 0)
-            label_dest = data_dir / split_name / "labels" / unique_label_name
-            process_label_file(label_path, label_dest)
+        tasks.extend((*pair, data_dir / split_name, link_mode, image_format) for pair in pairs)
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as pool:
+        placed = list(dict.fromkeys(dst.relative_to(data_dir).as_posix()
+                                    for dsts in pool.map(_copy_pair, tasks) for dst in dsts))
+    manifest_path.write_text(json.dumps({"fingerprint": fingerprint, **settings, "files": placed}, indent=2))
     
     print("Dataset preparation completed!")
     print(f"Data organized in:")
@@ -328,44 +463,132 @@ def prepare_global_dataset(train_ratio, val_ratio, test_ratio):
     print(f"  - /data/val: {len(val_pairs)} samples") 
     print(f"  - /data/test: {len(test_pairs)} samples")
 
-def has_product_class(label_path):
+def dataset_fingerprint(pairs, settings):
     """
-    Check if a label file contains class 5 (Product).
+    Hash of the source image/label files (path, mtime, size) and the split settings.
+    Only stat() is used, no file contents are read.
     
     Args:
-        label_path (Path): Path to the label file
+        pairs (list): (image path, label path) tuples
+        settings (dict): Split settings that change the prepared dataset
+        
+    Returns:
+        str: SHA-256 hex digest
+    """
+    entries = []
+    for pair in pairs:
+        for path in pair:
+            st = path.stat()
+            entries.append((str(path), st.st_mtime_ns, st.st_size))
+    entries.sort()
+    payload = json.dumps({"files": entries, "settings": settings}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def remove_manifest_files(data_dir, files):
+    """
+    Delete the split files a previous preparation placed, as listed in its manifest.
+    Only entries under data/{train,val,test}/ are touched.
+    
+    Args:
+        data_dir (Path): Dataset root the entries are relative to
+        files (list): POSIX paths relative to data_dir, e.g. "train/images/x.png"
         
     Returns:
-        bool: True if class 5 is present, False otherwise
+        int: Number of files removed
     """
+    removed = 0
+    for rel in files:
+        parts = Path(rel).parts
+        if len(parts) != 3 or parts[0] not in ("train", "val", "test") or ".." in parts:
+            print(f"Warning: Ignoring unexpected manifest entry {rel!r}")
+            continue
+        try:
+            (data_dir / rel).unlink()
+            removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+def _copy_pair(task):
+    """Place one image-label pair into a split folder (images/ and labels/), return the paths placed."""
+    img_path, label_path, product_labels, split_dir, link_mode, image_format = task
+    # Make unique filename by prefixing with week folder name
+    week_prefix = img_path.parent.name  # e.g., '2025-06-09_2025-06-15'
+
+    # Link (or copy) image, or re-encode it as lossless WebP
+    img_dest = split_dir / "images" / f"{week_prefix}_{img_path.stem}.{image_format}"
+    if image_format == "png":
+        link_or_copy(img_path, img_dest, link_mode)
+    else:
+        img = cv2.imread(str(img_path), cv2.IMREAD_UNCHANGED)
+        try:
+            # quality > 100 means lossless
+            ok = img is not None and cv2.imwrite(str(img_dest), img, [cv2.IMWRITE_WEBP_QUALITY, 101])
+        except cv2.error:
+            ok = False
+        if not ok:
+            # Skip the pair: no label without its image, and nothing to list in the manifest
+            print(f"Warning: Could not convert {img_path} to WebP, skipping it")
+            img_dest.unlink(missing_ok=True)
+            return ()
+
+    # Write label (only class 5, converted to class 0)
+    label_dest = split_dir / "labels" / f"{week_prefix}_{label_path.name}"
+    label_dest.write_text(product_labels)
+    return img_dest, label_dest
+
+def link_or_copy(src, dst, mode="hardlink"):
+    """
+    Place src at dst without copying bytes when possible.
+    Training never modifies images, so hardlinks are safe. Falls back to a copy
+    when the link fails (e.g. across filesystems).
+    
+    Args:
+        src (Path): Source file
+        dst (Path): Destination path, replaced if it exists
+        mode (str): "hardlink", "symlink" or "copy"
+    """
+    if dst.exists() or dst.is_symlink():
+        dst.unlink()
     try:
-        with open(label_path, 'r') as f:
-            for line in f:
-                parts = line.strip().split()
-                if parts and parts[0] == "5":
-                    return True
-        return False
-    except Exception as e:
-        print(f"Error reading label file {label_path}: {e}")
-        return False
+        if mode == "hardlink":
+            os.link(src, dst)
+            return
+        if mode == "symlink":
+            os.symlink(Path(src).resolve(), dst)
+            return
+    except OSError:
+        pass
+    shutil.copy2(src, dst)
 
-def process_label_file(input_path, output_path):
+_PRODUCT_LINE = re.compile(rb"^[ \t]*5(?:[ \t\r]|$)", re.MULTILINE)
+
+def read_product_lines(label_path):
     """
-    Process a label file to keep only class 5 (Product) and convert it to class 0.
+    Read a label file once and keep only class 5 (Product) lines, converted to class 0.
     
     Args:
-        input_path (Path): Input label file path
-        output_path (Path): Output label file path
+        label_path (Path): Path to the label file
+        
+    Returns:
+        str | None: Converted label file content, or None if class 5 is not present
     """
     try:
-        with open(input_path, 'r') as fin, open(output_path, 'w') as fout:
-            for line in fin:
-                parts = line.strip().split()
-                if parts and parts[0] == "5":
-                    # Convert class 5 to class 0 for single-class training
-                    fout.write("0 " + " ".join(parts[1:]) + "\n")
+        data = Path(label_path).read_bytes()
+        # C-level scan for a line whose first token is 5 rejects most files without parsing
+        if _PRODUCT_LINE.search(data) is None:
+            return None
+        text = data.decode()
     except Exception as e:
-        print(f"Error processing label file {input_path}: {e}")
+        print(f"Error reading label file {label_path}: {e}")
+        return None
+    out = []
+    for line in text.splitlines():
+        parts = line.split()
+        if parts and parts[0] == "5":
+            # Convert class 5 to class 0 for single-class training
+            out.append("0 " + " ".join(parts[1:]) + "\n")
+    return "".join(out)
 
 def write_evaluation_summary(summary_path, model_path, data_path, conf_threshold, image_files, all_detections):
     """
@@ -390,12 +613,13 @@ def write_evaluation_summary(summary_path, model_path, data_path, conf_threshold
         
         # Confidence distribution
         if all_detections:
-            confidences = [d['confidence'] for d in all_detections]
-            f.write(f"Confidence - Min: {min(confidences):.3f}, Max: {max(confidences):.3f}, "
-                   f"Mean: {sum(confidences)/len(confidences):.3f}\n")
+            confidences = np.fromiter((d['confidence'] for d in all_detections), dtype=np.float32,
+                                      count=len(all_detections))
+            f.write(f"Confidence - Min: {confidences.min():.3f}, Max: {confidences.max():.3f}, "
+                   f"Mean: {confidences.mean():.3f}\n")
         
         f.write(f"\nResults saved in: {summary_path.parent.absolute()}\n")
-        f.write("- detected_*.png: Images with bounding boxes drawn\n")
+        f.write("- detected_*: Images with bounding boxes drawn\n")
         f.write("- detections.txt: All detection data in CSV format\n")
         f.write("- summary.txt: This summary file\n")
 
@@ -412,16 +636,24 @@ def save_detections_to_txt(results_txt_path, model_path, data_path, conf_thresho
         all_detections (list): List of all detections made
     """
     print(f"Saving detection results to: {results_txt_path}")
-    with open(results_txt_path, 'w') as f:
+    header = [
+        "# YOLO Model Evaluation Results",
+        f"# Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
+        f"# Model: {model_path}",
+        f"# Data: {data_path}",
+        f"# Confidence threshold: {conf_threshold}",
+        f"# Total images processed: {len(image_files)}",
+        f"# Total detections: {len(all_detections)}",
+        "#",
+    ]
+    with open(results_txt_path, 'w', newline='') as f:
         # Write header
-        f.write("# YOLO Model Evaluation Results\n")
-        f.write(f"# Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-        f.write(f"# Model: {model_path}\n")
-        f.write(f"# Data: {data_path}\n")
-        f.write(f"# Confidence threshold: {conf_threshold}\n")
-        f.write(f"# Total images processed: {len(image_files)}\n")
-        f.write(f"# Total detections: {len(all_detections)}\n")
-        f.write("#\n")
+        f.write("\n".join(header) + "\n")
+        # One CSV row per detection, formatted in bulk by the csv module
+        if all_detections:
+            writer = csv.DictWriter(f, fieldnames=list(all_detections[0]), lineterminator="\n")
+            writer.writeheader()
+            writer.writerows(all_detections)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
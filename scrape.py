@@ -1,9 +1,21 @@
 import os, argparse, json
-from typing import Dict
-from utils.utils import ImageDownloader
-from utils.utils import WebDriverManager
-from utils.utils import DirectoryManager
-from utils.scrapers import ScraperFactory 
+from typing import Callable, Dict
+# selenium-backed utils.* modules are imported where a scrape actually runs,
+# so `--help` and usage errors return without loading them
+
+# (abs path, mtime_ns, size) -> parsed scraper_config.json
+_CONFIG_CACHE: Dict[tuple, Dict] = {}
+
+def _netto_url() -> str:
+    from utils.utils import DirectoryManager
+    return "https://wochenprospekt.netto-online.de/hz" + DirectoryManager.get_current_week_number() + "_wrse/?storeid=8135"
+
+# site name -> builder of its prospekt overview URL (called only for the selected site)
+SITE_URL_BUILDERS: Dict[str, Callable[[], str]] = {
+    'lidl': lambda: "https://www.lidl.de/c/online-prospekte/s10005610",
+    'angebote': lambda: "https://angebote.com/lidl/archives?page=1",
+    'netto': _netto_url,
+}
 
 # Configuration management
 class ScraperConfig:
@@ -16,25 +28,40 @@ class ScraperConfig:
             "window_size": "960,1080",
             "download_path": "data/originals",
             "max_pages": 100,
-            "timeout": 10
+            "timeout": 10,
+            "download_workers": 8,  # parallel page image downloads
+            "load_images": False,  # page image URLs come from the DOM, Chrome needn't fetch them
+            "page_load_strategy": "eager"  # don't wait for subresources, the scrapers use explicit waits
         }
         self.config = self.load_config()
     
     def load_config(self) -> Dict:
         """Load configuration from file or use defaults"""
-        if os.path.exists(self.config_file):
+        try:
+            st = os.stat(self.config_file)
+        except OSError:
+            return self.default_config
+        # parsed once per file version; a copy is returned since callers override keys
+        key = (os.path.abspath(self.config_file), st.st_mtime_ns, st.st_size)
+        if key not in _CONFIG_CACHE:
             try:
                 with open(self.config_file, 'r') as f:
-                    return {**self.default_config, **json.load(f)}
+                    _CONFIG_CACHE[key] = json.load(f)
             except:
                 return self.default_config
-        return self.default_config
+        return {**self.default_config, **_CONFIG_CACHE[key]}
     
     def save_config(self):
         """Save current configuration to file"""
         with open(self.config_file, 'w') as f:
             json.dump(self.config, f, indent=2)
             
+    @staticmethod
+    def url_for_site(site: str) -> str:
+        """Return the prospekt overview URL of a predefined site"""
+        builder = SITE_URL_BUILDERS.get(site.lower())
+        return builder() if builder else ""
+
     @staticmethod
     def get_url_to_scrape(args, parser) -> str:
         """Determine URL to scrape based on CLI arguments and config."""
@@ -43,13 +70,7 @@ class ScraperConfig:
             url = args.url
         elif args.site:
             # Predefined site
-            site = args.site.lower()
-            if site == 'lidl':
-                url = "https://www.lidl.de/c/online-prospekte/s10005610"
-            elif site == 'angebote':
-                url = "https://angebote.com/lidl/archives?page=1"
-            elif site == 'netto':
-                url = "https://wochenprospekt.netto-online.de/hz" + DirectoryManager.get_current_week_number() + "_wrse/?storeid=8135"
+            url = ScraperConfig.url_for_site(args.site)
         else:
             # No arguments provided - show help
             parser.print_help()
@@ -60,13 +81,65 @@ class ScraperConfig:
             return ""
         return url
 
+def run(site: str = None, download_path: str = None, num_prospekt: int = 1,
+        url: str = None, headless: bool = True, refresh_driver: bool = False) -> Dict:
+    """
+    Scrape one prospekt and return the scraper results dict.
+    Used by the CLI below and in-process by app/pipeline.py.
+    """
+    # Load configuration
+    config = ScraperConfig()
+    
+    # Override config with arguments
+    config.config['headless'] = headless
+
+    if download_path and site:
+        config.config['download_path'] = os.path.join(download_path, site)
+    elif download_path:
+        config.config['download_path'] = download_path
+    elif site:
+        config.config['download_path'] = os.path.join(config.config['download_path'], site)
+
+    if site and site.lower() == 'netto':
+        config.config['window_size'] = "1920,1080"
+        # the week dates are read from img[alt] right after loading, without a wait
+        config.config['page_load_strategy'] = "normal"
+
+    site_url = ScraperConfig.url_for_site(site) if site else ""
+    url = url or site_url
+    # the site's scraper is known up front; custom URLs are matched by the factory
+    scraper_site = site if url == site_url else None
+    if not url:
+        raise ValueError("Either a URL or a predefined site is required")
+    
+    from utils.utils import ImageDownloader, WebDriverManager, clear_chromedriver_cache
+    from utils.scrapers import ScraperFactory
+
+    if refresh_driver:
+        clear_chromedriver_cache()
+
+    # Setup components
+    driver_manager = WebDriverManager(
+        headless=config.config['headless'],
+        window_size=config.config['window_size'],
+        reuse=True,  # repeated in-process runs (app/pipeline.py) keep the browser warm
+        render_images=config.config['load_images'],
+        page_load_strategy=config.config['page_load_strategy']
+    )
+    image_downloader = ImageDownloader()
+
+    scraper = ScraperFactory.create_scraper(url, driver_manager, image_downloader, config.config, site=scraper_site)
+    print("[DEBUG] Scraper instance created successfully")
+    return scraper.scrape(url, config.config['download_path'], num_prospekt)
+
 def main():
     """Main function with command line argument support"""
         
     parser = argparse.ArgumentParser(description='Web scraper for prospekt/flyer websites')
     parser.add_argument('--url', '-u', type=str, help='URL to scrape')
-    parser.add_argument('--site', '-s', type=str, choices=['lidl', 'angebote', 'netto'], 
+    parser.add_argument('--site', '-s', type=str, choices=list(SITE_URL_BUILDERS), 
                        help='Predefined site to scrape')
+    # store_false: args.no_headless is the headless flag, False only when --no-headless is given
     parser.add_argument('--no-headless', action='store_false',
                        help='Run browser in no-headless mode (default is headless)')
     parser.add_argument('--download-path', '-d', type=str, 
@@ -74,42 +147,21 @@ def main():
     parser.add_argument('--num_prospekt', '--num-prospekt',
                         type=int, default=1,
                         help='Which prospekt to download (1-based index)')
+    parser.add_argument('--refresh-driver', action='store_true',
+                        help='Resolve the chromedriver binary again instead of using the cached path')
 
     args = parser.parse_args()
     
-    # Load configuration
-    config = ScraperConfig()
-    
-    # Override config with command line arguments
-    config.config['headless'] = args.no_headless if not args.no_headless else True
-
-    if args.download_path and args.site:
-        config.config['download_path'] = os.path.join(args.download_path, args.site)
-    elif args.download_path:
-        config.config['download_path'] = args.download_path
-    elif args.site:
-        config.config['download_path'] = os.path.join(config.config['download_path'], args.site)
-
-    if args.site.lower() == 'netto':
-        config.config['window_size'] = "1920,1080"
-    
-    # Setup components
-    driver_manager = WebDriverManager(
-        headless=config.config['headless'],
-        window_size=config.config['window_size']
-    )
-    image_downloader = ImageDownloader()
-    
     # Determine URLs to scrape
-    url = config.get_url_to_scrape(args, parser)
+    url = ScraperConfig.get_url_to_scrape(args, parser)
     if not url:
         print("No URLs provided to scrape. Exiting.")
         return
     
     try:
-        scraper = ScraperFactory.create_scraper(url, driver_manager, image_downloader, config.config)
-        print("[DEBUG] Scraper instance created successfully")
-        results = scraper.scrape(url, config.config['download_path'], args.num_prospekt)
+        results = run(site=args.site, download_path=args.download_path, num_prospekt=args.num_prospekt,
+                      url=url, headless=args.no_headless,
+                      refresh_driver=args.refresh_driver)
 
         if results['success']:
             print(f"✓ Successfully scraped {len(results['downloaded_images'])} images")
@@ -123,4 +175,4 @@ def main():
         print(f"✗ Unexpected error: {e}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
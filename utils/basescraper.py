@@ -4,11 +4,65 @@ from utils.utils import ImageDownloader
 
 from abc import ABC, abstractmethod
 from typing import List, Tuple, Optional, Dict
-import time
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException
 import os
+from concurrent.futures import ThreadPoolExecutor
+
+
+DOWNLOAD_WORKERS = 8  # parallel page image downloads
+BODY_LOCATOR = (By.CSS_SELECTOR, "body")
+
+# everything download_page_images reads from the page <img> elements, fetched in one round-trip
+_IMG_ATTRIBUTES_JS = """
+return arguments[0].map(function (img) {
+    if (!img || !img.getAttribute) return {};
+    return {
+        'data-src': img.getAttribute('data-src'),
+        'data-original': img.getAttribute('data-original'),
+        'data-large': img.getAttribute('data-large'),
+        'src': img.src,
+        'width': img.width || img.naturalWidth,
+        'height': img.height || img.naturalHeight
+    };
+});
+"""
+
+# given attributes of many elements in one round-trip; like WebElement.get_attribute, the DOM
+# property wins over the HTML attribute (absolute href/src), "text" is the rendered text
+_ELEMENT_ATTRIBUTES_JS = """
+var names = arguments[1];
+return arguments[0].map(function (el) {
+    var out = {};
+    names.forEach(function (n) {
+        var v = n === 'text' ? el.innerText : el[n];
+        if (v === undefined || v === null || typeof v === 'object') v = el.getAttribute(n);
+        out[n] = v;
+    });
+    return out;
+});
+"""
+
+# elements of the first selector (in order) that matches anything
+_FIRST_MATCH_JS = """
+for (const sel of arguments[0]) {
+    const els = document.querySelectorAll(sel);
+    if (els.length) return Array.from(els);
+}
+return [];
+"""
+
+
+class ImageAttributes:
+    """Snapshot of an <img> element's attributes, usable wherever a WebElement's get_attribute is"""
+
+    def __init__(self, attrs: dict):
+        self.attrs = attrs
+
+    def get_attribute(self, name: str):
+        return self.attrs.get(name)
 
 
 class BaseScraper(ABC):
@@ -21,6 +75,7 @@ class BaseScraper(ABC):
         self.config = config or {}
         self.max_pages = self.config.get('max_pages', 100)
         self.timeout = self.config.get('timeout', 5)
+        self.download_workers = self.config.get('download_workers', DOWNLOAD_WORKERS)
 
     @abstractmethod
     def handle_popups(self, driver) -> None:
@@ -51,6 +106,36 @@ class BaseScraper(ABC):
         """Extract week dates from the page, return in YYYY-MM-DD_YYYY-MM-DD format"""
         return None
 
+    def find_links(self, driver, locators, name_attribute: str = None) -> List[Tuple[str, str]]:
+        """
+        (name, href) of the links matched by the first CSS locator that finds any, without
+        duplicate hrefs. The name is taken from name_attribute, then the link text.
+        """
+        links: List[Tuple[str, str]] = []
+        seen = set()
+        # one wait for any of the selectors, instead of a full timeout per selector that misses
+        any_link = (By.CSS_SELECTOR, ", ".join(sel for _, sel in locators))
+        try:
+            WebDriverWait(driver, 5).until(EC.presence_of_element_located(any_link))
+        except TimeoutException:
+            return links
+        for locator in locators:
+            elements = driver.find_elements(*locator)
+            names = ("href", "text", name_attribute) if name_attribute else ("href", "text")
+            for attrs in self.get_element_attributes(driver, elements, names):
+                href = attrs["href"]
+                name = (name_attribute and attrs[name_attribute]) or attrs["text"] or 'Prospekt'
+                if href and href not in seen:
+                    seen.add(href)
+                    links.append((name.strip(), href))
+            if links:
+                break
+        return links
+
+    def find_first_elements(self, driver, locators) -> List:
+        """Elements of the first CSS locator that matches any, in one round-trip instead of one per locator"""
+        return driver.execute_script(_FIRST_MATCH_JS, [sel for _, sel in locators]) or []
+
     def select_prospekt(self, prospekt_links: List[Tuple[str, str]], index: int) -> str:
         """Return the URL of the prospekt specified by a 1-based index"""
         if not prospekt_links:
@@ -67,67 +152,108 @@ class BaseScraper(ABC):
         self.driver = self.driver_manager.setup_driver()
         return self.driver
     
+    def wait_for_prospekt(self, driver) -> None:
+        """Wait until an opened prospekt is ready to be scraped"""
+        WebDriverWait(driver, self.timeout).until(
+            EC.presence_of_element_located(BODY_LOCATOR)
+        )
+
+    def get_image_attributes(self, driver, img_elements: List) -> List[ImageAttributes]:
+        """Read the attributes of all page images with one execute_script instead of one call per attribute"""
+        if not img_elements:
+            return []
+        return [ImageAttributes(a or {}) for a in driver.execute_script(_IMG_ATTRIBUTES_JS, list(img_elements))]
+
+    def get_element_attributes(self, driver, elements: List, names: Tuple[str, ...]) -> List[Dict]:
+        """{name: value} per element, read with one execute_script instead of one call per attribute"""
+        if not elements:
+            return []
+        return driver.execute_script(_ELEMENT_ATTRIBUTES_JS, list(elements), list(names))
+
+    def wait_until_gone(self, driver, locator: Tuple[str, str]) -> None:
+        """Wait until a dismissed popup is hidden or removed, instead of sleeping a fixed time"""
+        try:
+            WebDriverWait(driver, self.timeout, poll_frequency=0.1).until(
+                EC.invisibility_of_element_located(locator)
+            )
+        except TimeoutException:
+            pass  # a lingering overlay is not fatal, page flips are clicked via JS
+
+    def wait_for_next_page(self, driver, seen_urls: set) -> None:
+        """Wait after a page flip until the page shows an image URL not downloaded yet"""
+        def new_image_shown(d):
+            for img in self.get_image_attributes(d, self.get_page_images(d)):
+                url = self.get_high_res_image_url(img)
+                if url and url not in seen_urls:
+                    return True
+            return False
+
+        try:
+            WebDriverWait(driver, self.timeout, poll_frequency=0.2).until(new_image_shown)
+        except TimeoutException:
+            pass  # the page is still processed, it will report "No images found"
+
     def download_page_images(self, driver, download_dir: str) -> List[str]:
         """Navigate through pages and download images or handle PDF if applicable"""
         
         page = 1
         max_pages = self.max_pages
-        downloaded_images = []
         downloaded_urls = set()
-        
-        while page <= max_pages:
-            time.sleep(1)
-            
-            try:
-                # Wait for page content to load
-                WebDriverWait(driver, self.timeout).until(
-                    EC.presence_of_element_located((By.CSS_SELECTOR, "body"))
-                )
+        # Selenium stays on this thread; the HTTP downloads run in the background
+        # while the browser moves on to the next page
+        downloads = []
+        # the pool is shut down (pending downloads finished) even if the page walk raises,
+        # before scrape() closes the shared HTTP session
+        with ThreadPoolExecutor(max_workers=self.download_workers) as pool:
+            while page <= max_pages:
+                try:
+                    # Wait for page content to load
+                    WebDriverWait(driver, self.timeout).until(
+                        EC.presence_of_element_located(BODY_LOCATOR)
+                    )
                 
-                images_found = False
-                page_urls = set()
+                    images_found = False
                 
-                img_elements = self.get_page_images(driver)
+                    img_elements = self.get_image_attributes(driver, self.get_page_images(driver))
      
-                for i, img in enumerate(img_elements):
-                    # Skip very small images
-                    try:
-                        width = img.get_attribute('width') or img.get_attribute('naturalWidth')
-                        height = img.get_attribute('height') or img.get_attribute('naturalHeight')
-                        
-                        if width and height:
-                            if int(width) < 200 or int(height) < 200:
-                                continue
-                    except:
-                        pass
+                    for i, img in enumerate(img_elements):
+                        # Skip very small images (0 means unknown, e.g. when Chrome doesn't load images)
+                        width = img.get_attribute('width')
+                        height = img.get_attribute('height')
+                        if width and height and (width < 200 or height < 200):
+                            continue
                     
-                    img_url = self.get_high_res_image_url(img)
-                    if img_url and img_url not in downloaded_urls and img_url not in page_urls:
-                        filename = f"page_{page:02d}.jpg"
-                        filepath = os.path.join(download_dir, filename)
-                        
-                        if self.image_downloader.download_image(img_url, filepath):
-                            downloaded_images.append(filename)
+                        img_url = self.get_high_res_image_url(img)
+                        if img_url and img_url not in downloaded_urls:
+                            filename = f"page_{page:02d}.jpg"
+                            filepath = os.path.join(download_dir, filename)
+                            future = pool.submit(self.image_downloader.download_image, img_url, filepath)
+                            downloads.append((filename, future))
                             downloaded_urls.add(img_url)
-                            page_urls.add(img_url)
                             images_found = True
-                            print(f"  ✓ Downloaded: {filename}")
                             break
-                        else:
-                            print(f"  ✗ Failed to download: {filename}")
                 
-                if not images_found:
-                    print(f"  No images found on page {page}")
+                    if not images_found:
+                        print(f"  No images found on page {page}")
                 
-            except Exception as e:
-                print(f"Error processing page {page}: {e}")
+                except Exception as e:
+                    print(f"Error processing page {page}: {e}")
             
-            # Try to navigate to next page
-            if not self.navigate_to_next_page(driver):
-                print("  No more pages found")
-                break
+                # Try to navigate to next page
+                if not self.navigate_to_next_page(driver):
+                    print("  No more pages found")
+                    break
+                self.wait_for_next_page(driver, downloaded_urls)
                 
-            page += 1
+                page += 1
+        
+            downloaded_images = []
+            for filename, future in downloads:
+                if future.result():
+                    downloaded_images.append(filename)
+                    print(f"  ✓ Downloaded: {filename}")
+                else:
+                    print(f"  ✗ Failed to download: {filename}")
         
         return downloaded_images
     
@@ -169,7 +295,10 @@ class BaseScraper(ABC):
             # Open prospekt
             if prospekt_url != url:  # Only navigate if it's a different URL
                 driver.get(prospekt_url)
-                time.sleep(5)
+                try:
+                    self.wait_for_prospekt(driver)
+                except TimeoutException:
+                    print("[DEBUG] Prospekt content did not show up in time, continuing")
             
             # Extract week dates from the actual prospekt  
             print(f"[DEBUG] Extracting week dates...")  
@@ -199,6 +328,9 @@ class BaseScraper(ABC):
             results['error'] = str(e)
             print(f"Error: {e}")
         finally:
-            driver.quit()
+            if self.driver is not None:
+                self.driver_manager.release_driver(self.driver)
+                self.driver = None
+            self.image_downloader.close()
         
         return results
@@ -3,13 +3,93 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException
 from selenium.webdriver.common.by import By
-import time, os, tempfile, requests, fitz, re
+import os, shutil, tempfile, requests, fitz, re
 from datetime import datetime, timedelta
+from functools import lru_cache
 from pathlib import Path
 from typing import List, Tuple, Optional
 
 
-from utils.utils import WebDriverManager, ImageDownloader
+from utils.utils import WebDriverManager, ImageDownloader, COPY_BUFSIZE
+
+_ENABLED = ":not([disabled]):not([class*='disabled' i])"
+# every enabled "next page" button candidate of the Lidl flyer viewer, in one query
+LIDL_NEXT_BTN_LOCATOR = (By.CSS_SELECTOR, ", ".join(sel + _ENABLED for sel in (
+    ".content_navigation--right button",
+    "button[aria-label*='next']",
+    "button[aria-label*='weiter']",
+)))
+
+LIDL_COOKIE_BANNER_LOCATOR = (By.ID, "onetrust-banner-sdk")
+LIDL_COOKIE_ACCEPT_LOCATOR = (By.CSS_SELECTOR, "#onetrust-accept-btn-handler")
+LIDL_STORE_POPUP_CLOSE_LOCATOR = (By.XPATH, "//button[@aria-label='Übersicht schließen']")
+LIDL_PAGE_IMG_LOCATOR = (By.CSS_SELECTOR, "div.page__wrapper img")
+# tried in order, the first one matching anything wins
+LIDL_PROSPEKT_LOCATORS = tuple((By.CSS_SELECTOR, sel) for sel in (
+    "a.flyer[data-track-name='Aktionsprospekt']",
+    "a.flyer[data-track-type='flyer']",
+    "a[href*='aktionsprospekt']",
+    ".flyer",
+))
+# <img> with a real URL: src is not an inline data: placeholder, or a lazy-loading attribute is set
+_HAS_URL = ":is(:not([src^='data:']), [data-src], [data-original], [data-large])"
+LIDL_IMG_LOCATORS = tuple((By.CSS_SELECTOR, sel + _HAS_URL) for sel in (
+    "div.page__wrapper img",
+    ".page img",
+    ".prospekt-page img",
+    "img[src*='prospekt']",
+    "img[data-src*='prospekt']",
+    "img",
+))
+
+ANGEBOTE_COOKIE_ACCEPT_LOCATOR = (By.CSS_SELECTOR, "[data-testid='cookie-accept'], .cookie-accept, #accept-cookies")
+ANGEBOTE_WEEK_LINK_LOCATOR = (By.CSS_SELECTOR, "a[href*='/lidl/woche-']")
+ANGEBOTE_PROSPEKT_LOCATORS = tuple((By.CSS_SELECTOR, sel) for sel in (
+    "a[href*='prospekt']",
+    "a[href*='/lidl/woche-']",
+    "a[href*='flyer']",
+    ".prospekt-link",
+    ".flyer-link",
+))
+ANGEBOTE_NEXT_LOCATORS = ((By.CSS_SELECTOR, "a[href*='seite']"),)
+ANGEBOTE_IMG_LOCATORS = tuple((By.CSS_SELECTOR, sel + _HAS_URL) for sel in (
+    ".prospekt-page img",
+    ".flyer-page img",
+    "img[src*='prospekt']",
+    "img[data-src*='prospekt']",
+    "img",
+))
+
+NETTO_ALT_IMG_LOCATOR = (By.CSS_SELECTOR, "img[alt]")
+
+# week ranges: Lidl prospekt URL (dd-mm-YYYY ... dd-mm-YYYY), angebote.com week link, Netto img alt (dd.mm.yy)
+LIDL_WEEK_RE = re.compile(r"(\d{2})-(\d{2})-(\d{4}).{0,12}?(\d{2})-(\d{2})-(\d{4})")
+ANGEBOTE_WEEK_RE = re.compile(r"ab-(\d{2})-(\d{2})-(\d{4})-bis-(\d{2})-(\d{2})-(\d{4})")
+NETTO_DATE_RE = re.compile(r"\b(\d{1,2})\.(\d{1,2})\.(\d{2})\b")
+
+# size and quality tokens of a Lidl image URL, rewritten together in one pass
+_LIDL_HIRES = re.compile(r"([wh])_(?:400|600|800)(?!\d)|q_auto")
+
+def _lidl_hires_repl(m: re.Match) -> str:
+    return f"{m.group(1)}_2000" if m.group(1) else "q_100"
+
+@lru_cache(maxsize=4096)
+def _lidl_high_res_url(url: str) -> str:
+    """Absolute URL of a Lidl flyer image, rewritten to the 2000px / q_100 rendition"""
+    if url.startswith('//'):
+        url = 'https:' + url
+    elif url.startswith('/'):
+        url = 'https://www.lidl.de' + url
+    
+    # Enhance resolution and quality
+    if 'w_' in url and 'h_' in url:
+        url = _LIDL_HIRES.sub(_lidl_hires_repl, url)
+        print(f"[DEBUG] Enhanced resolution/quality in URL: {url}")
+    elif 'q_auto' in url:
+        url = url.replace('q_auto', 'q_100')
+        print(f"[DEBUG] Enhanced quality in URL (q_): {url}")
+    
+    return url
 
 class LidlScraper(BaseScraper):
     """Scraper implementation for Lidl website"""
@@ -23,125 +103,71 @@ class LidlScraper(BaseScraper):
         
         # Handle cookie banner
         try:
-            wait.until(EC.presence_of_element_located((By.ID, "onetrust-banner-sdk")))
-            cookie_btn = wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR, "#onetrust-accept-btn-handler")))
+            wait.until(EC.presence_of_element_located(LIDL_COOKIE_BANNER_LOCATOR))
+            cookie_btn = wait.until(EC.element_to_be_clickable(LIDL_COOKIE_ACCEPT_LOCATOR))
             cookie_btn.click()
             print("✓ Accepted cookies")
-            time.sleep(2)
+            self.wait_until_gone(driver, LIDL_COOKIE_BANNER_LOCATOR)
         except TimeoutException:
             print("No cookie banner found")
         
         # Handle store selection popup
         try:
             close_btn = WebDriverWait(driver, 5).until(
-                EC.element_to_be_clickable((By.XPATH, "//button[@aria-label='Übersicht schließen']"))
+                EC.element_to_be_clickable(LIDL_STORE_POPUP_CLOSE_LOCATOR)
             )
             close_btn.click()
             print("✓ Closed store selection popup")
-            time.sleep(2)
+            self.wait_until_gone(driver, LIDL_STORE_POPUP_CLOSE_LOCATOR)
         except TimeoutException:
             print("No store selection popup found")
     
+    def wait_for_prospekt(self, driver) -> None:
+        """Wait until the first flyer page image is in the DOM"""
+        WebDriverWait(driver, self.timeout).until(
+            EC.presence_of_element_located(LIDL_PAGE_IMG_LOCATOR)
+        )
+
     def find_prospekt_links(self, driver) -> List[Tuple[str, str]]:
         """Find Lidl prospekt links"""
-        selectors = [
-            "a.flyer[data-track-name='Aktionsprospekt']",
-            "a.flyer[data-track-type='flyer']",
-            "a[href*='aktionsprospekt']",
-            ".flyer"
-        ]
-        
-        links: List[Tuple[str, str]] = []
-        for selector in selectors:
-            try:
-                elements = WebDriverWait(driver, 5).until(
-                    EC.presence_of_all_elements_located((By.CSS_SELECTOR, selector))
-                )
-                for element in elements:
-                    href = element.get_attribute("href")
-                    name = element.get_attribute('data-track-name') or element.text or 'Prospekt'
-                    if href and not any(href == l[1] for l in links):
-                        links.append((name.strip(), href))
-                        # print(f"[DEBUG] ✓ Found prospekt: {name}")
-                if links:
-                    break
-            except TimeoutException:
-                continue
-
-        return links
+        return self.find_links(driver, LIDL_PROSPEKT_LOCATORS, name_attribute='data-track-name')
     
     def get_high_res_image_url(self, img_element) -> Optional[str]:
         """Extract high-resolution image URL for Lidl"""
+        raw_url = self._extract_raw_url(img_element)
+        return _lidl_high_res_url(raw_url) if raw_url else None
+
+    @staticmethod
+    def _extract_raw_url(img_element) -> Optional[str]:
+        """First non-data: URL among the lazy-loading attributes, as found in the DOM"""
         url_attributes = ['data-src', 'data-original', 'data-large', 'src']
         
         for attr in url_attributes:
             url = img_element.get_attribute(attr)
-            if url:
-                if url.startswith('data:'):
-                    continue
-                if url.startswith('//'):
-                    url = 'https:' + url
-                elif url.startswith('/'):
-                    url = 'https://www.lidl.de' + url
-                
-                # Enhance resolution
-                if 'w_' in url and 'h_' in url:
-                    url = url.replace('w_400', 'w_2000').replace('h_400', 'h_2000')
-                    url = url.replace('w_600', 'w_2000').replace('h_600', 'h_2000')
-                    url = url.replace('w_800', 'w_2000').replace('h_800', 'h_2000')
-                    print(f"[DEBUG] Enhanced resolution in URL (w_): {url}")
-                
-                if 'q_' in url:
-                    url = url.replace('q_auto', 'q_100')
-                    print(f"[DEBUG] Enhanced quality in URL (q_): {url}")
-                
+            if url and not url.startswith('data:'):
                 return url
         
         return None
     
     def navigate_to_next_page(self, driver) -> bool:
         """Navigate to next page for Lidl prospekt"""
-        next_selectors = [
-            "div.content_navigation.content_navigation--right button",
-            ".content_navigation--right button",
-            "button[aria-label*='next']",
-            "button[aria-label*='weiter']"
-        ]
-        
-        for selector in next_selectors:
-            try:
-                elements = driver.find_elements(By.CSS_SELECTOR, selector)
-                for btn in elements:
-                    if (btn.is_displayed() and btn.is_enabled() and 
-                        not btn.get_attribute("disabled") and 
-                        "disabled" not in (btn.get_attribute("class") or "").lower()):
-                        driver.execute_script("arguments[0].click();", btn)
-                        return True
-            except:
-                continue
+        try:
+            # disabled buttons are filtered by the browser, only visibility is checked here
+            for btn in driver.find_elements(*LIDL_NEXT_BTN_LOCATOR):
+                if btn.is_displayed():
+                    driver.execute_script("arguments[0].click();", btn)
+                    return True
+        except:
+            pass
         
         return False
     
     def get_page_images(self, driver) -> List:
         """Get image elements from current page for Lidl"""
-        img_selectors = [
-            "div.page__wrapper img",
-            ".page img",
-            ".prospekt-page img",
-            "img[src*='prospekt']",
-            "img[data-src*='prospekt']",
-            "img"
-        ]
-        
-        for selector in img_selectors:
-            try:
-                img_elements = driver.find_elements(By.CSS_SELECTOR, selector)
-                if img_elements:
-                    return img_elements
-            except:
-                continue
-        
-        return []
+        try:
+            return self.find_first_elements(driver, LIDL_IMG_LOCATORS)
+        except:
+            return []
 
     def get_week_dates(self, driver) -> Optional[str]:
         """
@@ -149,9 +175,6 @@ class LidlScraper(BaseScraper):
         .../aktionsprospekt-DD-MM-YYYY-DD-MM-YYYY-... -> 'YYYY-MM-DD_YYYY-MM-DD'
         If the range looks like Mon-Sat (6 days), optionally extend to Sunday.
         """
-        import re
-        from datetime import datetime, timedelta
-
         # Prefer canonical link if present; fall back to current URL
         try:
             url = (driver.find_element(By.XPATH, "//link[@rel='canonical']")
@@ -159,7 +182,7 @@ class LidlScraper(BaseScraper):
         except Exception:
             url = driver.current_url
 
-        m = re.search(r"(\d{2})-(\d{2})-(\d{4}).{0,12}?(\d{2})-(\d{2})-(\d{4})", url)
+        m = LIDL_WEEK_RE.search(url)
         if not m:
             return None
 
@@ -184,57 +207,31 @@ class AngeboteScraper(BaseScraper):
         try:
             # Example: Accept cookies if present
             cookie_btn = WebDriverWait(driver, self.config.get("timeout", 5)).until(
-                EC.element_to_be_clickable((By.CSS_SELECTOR, "[data-testid='cookie-accept'], .cookie-accept, #accept-cookies"))
+                EC.element_to_be_clickable(ANGEBOTE_COOKIE_ACCEPT_LOCATOR)
             )
             cookie_btn.click()
             print("✓ Accepted cookies")
-            time.sleep(2)
+            self.wait_until_gone(driver, ANGEBOTE_COOKIE_ACCEPT_LOCATOR)
         except TimeoutException:
             print("No cookie banner found")
     
     def find_prospekt_links(self, driver) -> List[Tuple[str, str]]:
         """Find prospekt links on angebote.com"""
         # This would need to be implemented based on angebote.com's structure
-        selectors = [
-            "a[href*='prospekt']",
-            "a[href*='/lidl/woche-']",
-            "a[href*='flyer']",
-            ".prospekt-link",
-            ".flyer-link"
-        ]
-
-        links: List[Tuple[str, str]] = []
-        for selector in selectors:
-            try:
-                elements = WebDriverWait(driver, 5).until(
-                    EC.presence_of_all_elements_located((By.CSS_SELECTOR, selector))
-                )
-                for element in elements:
-                    href = element.get_attribute("href")
-                    name = element.text or 'Prospekt'
-                    if href and not any(href == l[1] for l in links):
-                        links.append((name.strip(), href))
-                        print(f"✓ Found prospekt: {href}")
-                if links:
-                    break
-            except TimeoutException:
-                continue
-
+        links = self.find_links(driver, ANGEBOTE_PROSPEKT_LOCATORS)
+        for _, href in links:
+            print(f"✓ Found prospekt: {href}")
         return links
     
     def get_week_dates(self, driver) -> Optional[str]:
         """Extract week dates from angebote.com page"""
-        import re
-        from datetime import datetime
-        
          # Find all <a> tags with href containing '/lidl/woche-'
-        links = driver.find_elements(By.CSS_SELECTOR, "a[href*='/lidl/woche-']")
-        for link in links:
-            href = link.get_attribute("href")
-            # Debug print
-            print(f"Checking href: {href}")
+        links = driver.find_elements(*ANGEBOTE_WEEK_LINK_LOCATOR)
+        for attrs in self.get_element_attributes(driver, links, ("href",)):
+            href = attrs["href"] or ""
+            # print(f"[DEBUG] Checking href: {href}")
             # Example href: /lidl/woche-26-ab-23-06-2025-bis-28-06-2025-seite-1-zdplp
-            match = re.search(r"ab-(\d{2})-(\d{2})-(\d{4})-bis-(\d{2})-(\d{2})-(\d{4})", href)
+            match = ANGEBOTE_WEEK_RE.search(href)
             if match:
                 start_day, start_month, start_year, end_day, end_month, end_year = match.groups()
                 start_date = f"{start_year}-{start_month}-{start_day}"
@@ -266,13 +263,9 @@ class AngeboteScraper(BaseScraper):
     
     def navigate_to_next_page(self, driver) -> bool:
         """Navigate to next page for angebote.com"""
-        next_selectors = [
-            "a[href*='seite']",
-        ]
-        
-        for selector in next_selectors:
+        for locator in ANGEBOTE_NEXT_LOCATORS:
             try:
-                btn = driver.find_element(By.CSS_SELECTOR, selector)
+                btn = driver.find_element(*locator)
                 if btn.is_displayed() and btn.is_enabled():
                     driver.execute_script("arguments[0].click();", btn)
                     return True
@@ -283,23 +276,10 @@ class AngeboteScraper(BaseScraper):
     
     def get_page_images(self, driver) -> List:
         """Get image elements from current page for angebote.com"""
-        img_selectors = [
-            ".prospekt-page img",
-            ".flyer-page img",
-            "img[src*='prospekt']",
-            "img[data-src*='prospekt']",
-            "img"
-        ]
-        
-        for selector in img_selectors:
-            try:
-                img_elements = driver.find_elements(By.CSS_SELECTOR, selector)
-                if img_elements:
-                    return img_elements
-            except:
-                continue
-        
-        return []
+        try:
+            return self.find_first_elements(driver, ANGEBOTE_IMG_LOCATORS)
+        except:
+            return []
 
 class NettoScraper(BaseScraper):
     """Scraper implementation for Netto website"""
@@ -362,15 +342,16 @@ class NettoScraper(BaseScraper):
     def get_week_dates(self, driver) -> Optional[str]:
         """Extract week dates from img[alt]; fallback case is  Mon-Sat."""
         try:
+            imgs = driver.find_elements(*NETTO_ALT_IMG_LOCATOR)
             alts = " ".join(
-                (el.get_attribute("alt") or "").strip()
-                for el in driver.find_elements(By.CSS_SELECTOR, "img[alt]")
+                (attrs["alt"] or "").strip()
+                for attrs in self.get_element_attributes(driver, imgs, ("alt",))
             )
         except Exception:
             alts = ""
 
         # dd.mm.yy
-        m = re.findall(r"\b(\d{1,2})\.(\d{1,2})\.(\d{2})\b", alts)
+        m = NETTO_DATE_RE.findall(alts)
         if len(m) >= 2:
             dates = []
             for d, mo, y in m:
@@ -410,10 +391,9 @@ class NettoScraper(BaseScraper):
             with requests.get(pdf_url, headers=headers, stream=True, timeout=30) as r:
                 r.raise_for_status()
                 fd, tmp_pdf_path = tempfile.mkstemp(suffix=".pdf")
+                r.raw.decode_content = True
                 with os.fdopen(fd, "wb") as f:
-                    for chunk in r.iter_content(65536):
-                        if chunk:
-                            f.write(chunk)
+                    shutil.copyfileobj(r.raw, f, COPY_BUFSIZE)
 
             # 2) render to JPEGs (≈200 DPI)
             doc = fitz.open(tmp_pdf_path)
@@ -435,15 +415,34 @@ class NettoScraper(BaseScraper):
 
 class ScraperFactory:
     """Factory class to create appropriate scraper instances"""
-    
+
+    # site key (as in scrape.py --site) -> scraper class
+    SCRAPER_CLASSES = {
+        'lidl': LidlScraper,
+        'angebote': AngeboteScraper,
+        'netto': NettoScraper,
+    }
+    # URL fragment -> site key, for custom --url runs
+    URL_SITES = {
+        'lidl.de': 'lidl',
+        'angebote.com': 'angebote',
+        'netto-online.de': 'netto',
+    }
+
+    @staticmethod
+    def detect_site(url: str) -> str:
+        """Site key of a URL"""
+        for fragment, site in ScraperFactory.URL_SITES.items():
+            if fragment in url:
+                return site
+        raise ValueError(f"No scraper available for URL: {url}")
+
     @staticmethod
-    def create_scraper(url: str, driver_manager: WebDriverManager, image_downloader: ImageDownloader, config: dict = None) -> BaseScraper:
-        """Create appropriate scraper based on URL"""
-        if 'lidl.de' in url:
-            return LidlScraper(driver_manager, image_downloader, config)
-        elif 'angebote.com' in url:
-            return AngeboteScraper(driver_manager, image_downloader, config)
-        elif 'netto-online.de' in url:
-            return NettoScraper(driver_manager, image_downloader, config)
-        else:
-            raise ValueError(f"No scraper available for URL: {url}")
+    def create_scraper(url: str, driver_manager: WebDriverManager, image_downloader: ImageDownloader, config: dict = None,
+                       site: str = None) -> BaseScraper:
+        """Create the scraper for a known site, or based on the URL if no site is given"""
+        site = site.lower() if site else ScraperFactory.detect_site(url)
+        scraper_cls = ScraperFactory.SCRAPER_CLASSES.get(site)
+        if scraper_cls is None:
+            raise ValueError(f"No scraper available for site: {site}")
+        return scraper_cls(driver_manager, image_downloader, config)
@@ -1,22 +1,52 @@
+import atexit
 import os
+import shutil
+import threading
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from datetime import datetime, timedelta
 from typing import Optional, Dict
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.chrome.service import Service
+from selenium.common.exceptions import SessionNotCreatedException
 from webdriver_manager.chrome import ChromeDriverManager
-from ultralytics import YOLO
+
+try:
+    # HTTP/2: all page downloads multiplexed over one TLS connection; optional,
+    # the pooled requests session below is used otherwise
+    import httpx
+    import h2  # noqa: F401  (httpx needs it for http2=True)
+except ImportError:
+    httpx = None
+
+COPY_BUFSIZE = 1 << 20  # page images are a few MB, copy them in 1 MiB blocks
 
 
 class ImageDownloader:
     """Handles image downloading functionality"""
 
-    def __init__(self):
+    def __init__(self, pool_size: int = 16):
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         }
+        self.client = None
+        if httpx is not None:
+            self.client = httpx.Client(
+                headers=self.headers, timeout=httpx.Timeout(30.0, connect=5.0),
+                transport=httpx.HTTPTransport(http2=True, retries=3,
+                                              limits=httpx.Limits(max_connections=pool_size)),
+            )
+        # One keep-alive connection pool shared by all downloads (and download threads)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=8, pool_maxsize=pool_size,
+            max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=(429, 500, 502, 503, 504)),
+        )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
 
     def download_image(self, url: str, filepath: str, headers: Optional[Dict] = None) -> bool:
         """Download image from URL to filepath"""
@@ -24,18 +54,32 @@ class ImageDownloader:
             if headers is None:
                 headers = self.headers
 
-            response = requests.get(url, headers=headers, stream=True)
-            response.raise_for_status()
+            if self.client is not None:
+                with self.client.stream("GET", url, headers=headers) as response:
+                    response.raise_for_status()
+                    with open(filepath, 'wb') as f:
+                        for chunk in response.iter_bytes(COPY_BUFSIZE):
+                            f.write(chunk)
+                return True
+
+            with self.session.get(url, headers=headers, stream=True, timeout=(5, 30)) as response:
+                response.raise_for_status()
 
-            with open(filepath, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
+                response.raw.decode_content = True  # undo gzip/deflate like iter_content did
+                with open(filepath, 'wb') as f:
+                    shutil.copyfileobj(response.raw, f, COPY_BUFSIZE)
 
             return True
         except Exception as e:
             print(f"Error downloading {url}: {e}")
             return False
 
+    def close(self) -> None:
+        """Close the pooled connections"""
+        if self.client is not None:
+            self.client.close()
+        self.session.close()
+
 class DirectoryManager:
     """Manages directory creation and file paths"""
 
@@ -68,14 +112,143 @@ class DirectoryManager:
         """Get current week number"""
         now = datetime.now()
         return str(now.isocalendar()[1])
+class DriverPool:
+    """
+    Keeps finished Chrome sessions alive so the next scrape skips the browser cold start.
+    Drivers are handed out exclusively, concurrent scrapes each get their own browser.
+    """
+
+    def __init__(self):
+        self._idle: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, key: tuple, launch):
+        """Return an idle live driver for key, or a new one from launch()"""
+        while True:
+            with self._lock:
+                idle = self._idle.get(key)
+                driver = idle.pop() if idle else None
+            if driver is None:
+                return launch()
+            try:
+                driver.current_url  # raises if the browser died meanwhile
+                return driver
+            except Exception:
+                self._quit(driver)
+
+    def release(self, key: tuple, driver) -> None:
+        """Reset a driver (cookies, page) and park it for reuse"""
+        try:
+            driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+            driver.get("about:blank")
+        except Exception:
+            self._quit(driver)
+            return
+        with self._lock:
+            self._idle.setdefault(key, []).append(driver)
+
+    def close_all(self) -> None:
+        with self._lock:
+            drivers = [d for idle in self._idle.values() for d in idle]
+            self._idle.clear()
+        for driver in drivers:
+            self._quit(driver)
+
+    @staticmethod
+    def _quit(driver) -> None:
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+_DRIVER_POOL = DriverPool()
+atexit.register(_DRIVER_POOL.close_all)
+
+# chromedriver location resolved by webdriver_manager, remembered across runs
+CHROMEDRIVER_PATH_CACHE = os.path.join(os.path.expanduser("~"), ".cache", "grgrie_preis", "chromedriver_path.txt")
+_chromedriver_path: Optional[str] = None
+
+def get_chromedriver_path() -> str:
+    """
+    Path of the chromedriver binary. ChromeDriverManager().install() looks up the Chrome
+    version and the driver release on every call, so its result is kept in memory and in
+    CHROMEDRIVER_PATH_CACHE, and only re-resolved when the cached binary is gone.
+    """
+    global _chromedriver_path
+    if _chromedriver_path and os.path.exists(_chromedriver_path):
+        return _chromedriver_path
+    try:
+        with open(CHROMEDRIVER_PATH_CACHE, 'r') as f:
+            path = f.read().strip()
+    except OSError:
+        path = ""
+    if not path or not os.path.exists(path):
+        path = ChromeDriverManager().install()
+        try:
+            os.makedirs(os.path.dirname(CHROMEDRIVER_PATH_CACHE), exist_ok=True)
+            with open(CHROMEDRIVER_PATH_CACHE, 'w') as f:
+                f.write(path)
+        except OSError as e:
+            print(f"[DEBUG] Could not cache chromedriver path: {e}")
+    _chromedriver_path = path
+    return path
+
+def clear_chromedriver_cache() -> None:
+    """Forget the cached chromedriver path, e.g. after a Chrome update"""
+    global _chromedriver_path
+    _chromedriver_path = None
+    try:
+        os.remove(CHROMEDRIVER_PATH_CACHE)
+    except OSError:
+        pass
+
 class WebDriverManager:
     """Manages WebDriver setup and configuration"""
 
-    def __init__(self, headless=True, window_size="960,1080"):
+    _OPTIONS_CACHE: Dict[tuple, Options] = {}
+
+    def __init__(self, headless=True, window_size="960,1080", reuse=False, render_images=True,
+                 page_load_strategy="normal"):
         self.headless = headless
         self.window_size = window_size
+        # False: Chrome skips fetching/decoding images, the scrapers only read <img> URLs
+        self.render_images = render_images
+        # "eager": driver.get returns at DOMContentLoaded, the scrapers wait for what they need
+        self.page_load_strategy = page_load_strategy
+        # reuse=True takes browsers from / returns them to the process-wide DriverPool
+        self.reuse = reuse
+
+    @property
+    def _pool_key(self) -> tuple:
+        return (self.headless, self.window_size, self.render_images, self.page_load_strategy)
 
     def setup_driver(self):
+        if self.reuse:
+            return _DRIVER_POOL.acquire(self._pool_key, self._launch_driver)
+        return self._launch_driver()
+
+    def release_driver(self, driver) -> None:
+        """Hand a driver back when a scrape is done: parked for reuse, or quit"""
+        if self.reuse:
+            _DRIVER_POOL.release(self._pool_key, driver)
+        else:
+            driver.quit()
+
+    def _launch_driver(self):
+        options = self._chrome_options()
+        try:
+            return webdriver.Chrome(service=Service(get_chromedriver_path()), options=options)
+        except SessionNotCreatedException:
+            # Chrome was updated and the cached driver no longer matches it
+            print("[DEBUG] Cached chromedriver rejected, resolving it again")
+            clear_chromedriver_cache()
+            return webdriver.Chrome(service=Service(get_chromedriver_path()), options=options)
+
+    def _chrome_options(self) -> Options:
+        """ChromeOptions for this configuration, built once per _pool_key"""
+        options = WebDriverManager._OPTIONS_CACHE.get(self._pool_key)
+        if options is not None:
+            return options
         options = Options()
         if self.headless:
             # modern headless flag
@@ -90,8 +263,20 @@ class WebDriverManager:
         options.add_argument("--no-sandbox")
         options.add_argument("--disable-dev-shm-usage")
         options.add_argument(f"--window-size={self.window_size}")
-        service = Service(ChromeDriverManager().install())
-        return webdriver.Chrome(service=service, options=options)
+        # browser features a scrape never uses
+        options.add_argument("--disable-gpu")
+        options.add_argument("--disable-extensions")
+        options.add_argument("--disable-background-networking")
+        options.add_argument("--disable-sync")
+        options.add_argument("--disable-features=Translate,MediaRouter")
+        options.page_load_strategy = self.page_load_strategy
+        prefs = {"profile.default_content_setting_values.notifications": 2}
+        if not self.render_images:
+            prefs["profile.managed_default_content_settings.images"] = 2
+            options.add_argument("--blink-settings=imagesEnabled=false")
+        options.add_experimental_option("prefs", prefs)
+        WebDriverManager._OPTIONS_CACHE[self._pool_key] = options
+        return options
 
 
 
@@ -101,6 +286,7 @@ class ONNXExporter:
     @staticmethod
     def export_to_onnx(pt_path="models/best.pt", onnx_path="models/best.onnx"):
         """Exports a YOLO model from .pt to .onnx format"""
+        from ultralytics import YOLO  # torch is only needed here, not for scraping
         model = YOLO(pt_path)
         model.export(format="onnx", dynamic=True)
         print(f"Exported {pt_path} to {onnx_path}")
\ No newline at end of file